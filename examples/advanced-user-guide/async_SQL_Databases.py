@@ -1,12 +1,15 @@
 """Import and set up `SQLAlchemy`
 """
-from typing import List
+import asyncio
+import json
+from typing import List, Optional
 
 # importing databases
 import databases
 # importing sqlalchemy
 import sqlalchemy
-from fastapi import FastAPI
+from fastapi import FastAPI, Query, Response
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 
 # SQLAlchemy specific code, as with any other app
@@ -27,6 +30,9 @@ notes = sqlalchemy.Table(
     sqlalchemy.Column("id", sqlalchemy.Integer, primary_key=True),
     sqlalchemy.Column("text", sqlalchemy.String),
     sqlalchemy.Column("completed", sqlalchemy.Boolean),
+    # an index on `(completed, id)`, so the notes with a given `completed`
+    # value can be found, already sorted by `id`, without reading the others
+    sqlalchemy.Index("ix_notes_completed_id", "completed", "id"),
 )
 
 # creating an `engine`
@@ -59,26 +65,213 @@ app = FastAPI()
 @app.on_event("startup")
 async def startup():
     await database.connect()
+    # `create_all` skips the tables that already exist, with their indexes, so
+    # in a database made before the index was added, it's created here
+    await database.execute(
+        "CREATE INDEX IF NOT EXISTS ix_notes_completed_id ON notes (completed, id)"
+    )
 
 
 @app.on_event("shutdown")
 async def shutdown():
+    # save the notes still waiting in `note_batcher` (see below)
+    await note_batcher.flush()
     await database.disconnect()
 
 
+"""FILTERING AND PAGINATING NOTES
+`?completed=false` only returns the open notes, and `?after=<id>&limit=<n>`
+returns the next `n` notes after the note with that `id` (keyset pagination).
+
+The query is:
+`WHERE completed = :completed AND id > :after ORDER BY id LIMIT :limit`
+With the index on `(completed, id)` the database goes straight to the first
+note of the page in the index and reads the next `limit` entries, however deep
+the page is and however many notes have the other `completed` value.
+
+`limit` is 100 by default, and at most 1000, so a single request never reads
+the whole table. When a page is full, there might be more: the `X-Next-Cursor`
+header has the `id` to send as `?after=` for the next page. To get all the
+notes at once, use `/notes/stream` (below).
+"""
+MAX_NOTES_PAGE = 1000
+
+def notes_page_query(
+    completed: Optional[bool] = None,
+    after: Optional[int] = None,
+    limit: Optional[int] = None,
+):
+    query = notes.select().order_by(notes.c.id)
+    if completed is not None:
+        query = query.where(notes.c.completed == completed)
+    if after is not None:
+        query = query.where(notes.c.id > after)
+    if limit is not None:
+        query = query.limit(limit)
+    return query
+
+
 # creating the *path operation function* to read notes
 @app.get("/notes/", response_model=List[Note])
-async def read_notes():
+async def read_notes(
+    response: Response,
+    completed: Optional[bool] = None,
+    after: Optional[int] = None,
+    limit: int = Query(100, ge=1, le=MAX_NOTES_PAGE),
+):
     """The `response_model=List[Note]` uses `typing.List`
     That documents (and validates, serializes, filters) the output data, as a `list` of `Note`s.
     """
-    query = notes.select()
-    return await database.fetch_all(query)
+    query = notes_page_query(completed=completed, after=after, limit=limit)
+    page = await database.fetch_all(query)
+    if len(page) == limit:
+        response.headers["X-Next-Cursor"] = str(page[-1]["id"])
+    return page
+
+
+"""STREAMING THE NOTES
+`read_notes` reads all the notes with `fetch_all` into a `list`, then checks
+all of them against `List[Note]`, and only then starts sending the response.
+The memory used and the time until the first byte is sent both grow with the
+number of notes.
+
+`stream_notes` uses `database.iterate()` instead, that gives the rows one by
+one as they are read from the database. Each row is converted to JSON right
+away and added to a buffer, and the buffer is sent (and emptied) every time it
+gets to `chunk_size` bytes. The `[` is sent before reading anything.
+
+The response is the same JSON array as in `read_notes`.
+"""
+async def iterate_json_array(database, query, chunk_size: int = 64 * 1024):
+    yield "["
+    buffer = []
+    size = 0
+    separator = ""
+    async for row in database.iterate(query):
+        note = {name: row[name] for name in Note.__fields__}
+        text = separator + json.dumps(note)
+        separator = ","
+        buffer.append(text)
+        size += len(text)
+        if size >= chunk_size:
+            yield "".join(buffer)
+            buffer = []
+            size = 0
+    buffer.append("]")
+    yield "".join(buffer)
+
+
+@app.get("/notes/stream", response_model=List[Note])
+async def stream_notes():
+    return StreamingResponse(
+        iterate_json_array(database, notes.select()), media_type="application/json"
+    )
+
+
+class NoteBatcher:
+    """BATCHING WRITES
+    Each `create_note` does its own `INSERT`, and each `INSERT` is its own
+    transaction (for SQLite, its own write to disk). When many notes are
+    created at the same time, most of that time is spent on the transactions,
+    not on the notes.
+
+    The `NoteBatcher` collects the notes of all the requests that arrive within
+    `max_delay` seconds (or until there are `max_rows` of them) and inserts all
+    of them with a single multi-row `INSERT`, in a single transaction. Each
+    request `await`s a future that gets the `id` of its own note.
+
+    Getting the IDs:
+    - SQLite gives consecutive IDs to the rows of a single `INSERT` (nobody else
+    can write in between), and `execute` returns the last one, so the IDs are
+    the `len(batch)` numbers up to that one.
+    - Other databases (like PostgreSQL) can return them with `RETURNING`.
+
+    SQLite accepts up to 999 parameters per statement in older versions, each
+    note uses 2, so `max_rows` should stay under 499.
+
+    A batch is always written by its own task, not by the request that
+    completed it: if that request is cancelled (e.g. the client went away),
+    the other requests of the batch still get their IDs.
+    """
+    def __init__(self, database, max_rows: int = 100, max_delay: float = 0.005):
+        self.database = database
+        self.max_rows = max_rows
+        self.max_delay = max_delay
+        self.pending = []
+        self._timer = None
+        self._flush_task = None
+        self._lock = asyncio.Lock()
+
+    async def insert(self, note: NoteIn) -> int:
+        future = asyncio.get_running_loop().create_future()
+        self.pending.append((note.dict(), future))
+        if len(self.pending) >= self.max_rows:
+            # one flush at a time, it writes everything pending before it ends
+            if self._flush_task is None:
+                self._flush_task = asyncio.ensure_future(self.flush())
+                self._flush_task.add_done_callback(self._flush_done)
+        elif self._timer is None:
+            self._timer = asyncio.ensure_future(self._flush_later())
+        return await future
+
+    def _flush_done(self, task):
+        self._flush_task = None
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.max_delay)
+        self._timer = None
+        await self.flush()
+
+    async def flush(self):
+        """Write all the pending notes, in `INSERT`s of at most `max_rows` rows,
+        including the ones added while writing.
+        """
+        async with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            while self.pending:
+                batch = self.pending[: self.max_rows]
+                del self.pending[: self.max_rows]
+                await self._write_batch(batch)
+
+    async def _write_batch(self, batch):
+        try:
+            ids = await self._insert_batch([values for values, _ in batch])
+        except Exception as exc:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(exc)
+            return
+        except BaseException:
+            # cancelled, don't leave the requests waiting forever
+            for _, future in batch:
+                future.cancel()
+            raise
+        for (_, future), note_id in zip(batch, ids):
+            if not future.done():
+                future.set_result(note_id)
+
+    async def _insert_batch(self, rows):
+        query = notes.insert().values(rows)
+        async with self.database.transaction():
+            if self.database.url.dialect == "sqlite":
+                last_id = await self.database.execute(query)
+                return range(last_id - len(rows) + 1, last_id + 1)
+            result = await self.database.fetch_all(query.returning(notes.c.id))
+            return [row["id"] for row in result]
+
+
+# set to `True` to create the notes in batches
+BATCH_WRITES = False
+note_batcher = NoteBatcher(database)
 
 
 # creating the *path operation function* to create notes
 @app.post("/notes/", response_model=Note)
 async def create_note(note: NoteIn):
+    if BATCH_WRITES:
+        return {**note.dict(), "id": await note_batcher.insert(note)}
     query = notes.insert().values(text=note.text, completed=note.completed)
     last_record_id = await database.execute(query)
     return {**note.dict(), "id": last_record_id}
@@ -0,0 +1,66 @@
+"""
+Inserts per second in `async_SQL_Databases.py` with many concurrent writers:
+one `INSERT` per note vs the `NoteBatcher`.
+
+`python benchmark_async_SQL_Databases.py [writers] [rounds]`
+
+It uses its own SQLite file in a temporary directory, not `test.db`.
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+import databases
+import sqlalchemy
+
+from async_SQL_Databases import NoteBatcher, NoteIn, metadata, notes
+
+
+async def single_inserts(database, note):
+    query = notes.insert().values(text=note.text, completed=note.completed)
+    return await database.execute(query)
+
+
+async def run(database, insert, writers: int, rounds: int):
+    note = NoteIn(text="benchmark", completed=False)
+    start = time.perf_counter()
+    ids = []
+    for _ in range(rounds):
+        ids += await asyncio.gather(*(insert(note) for _ in range(writers)))
+    elapsed = time.perf_counter() - start
+    assert len(set(ids)) == len(ids)
+    return len(ids) / elapsed
+
+
+async def main(writers: int = 500, rounds: int = 1):
+    with tempfile.TemporaryDirectory() as directory:
+        url = "sqlite:///" + os.path.join(directory, "notes.db")
+        metadata.create_all(sqlalchemy.create_engine(url))
+        # with one connection per writer, SQLite makes them wait for each other,
+        # give them long enough to not fail with "database is locked"
+        database = databases.Database(url, timeout=60)
+        await database.connect()
+        try:
+            print(f"{writers} concurrent writers, {rounds} rounds")
+            direct = await run(
+                database,
+                lambda note: single_inserts(database, note),
+                writers,
+                rounds,
+            )
+            print(f"one INSERT per note: {direct:10.0f} inserts/s")
+            batcher = NoteBatcher(database)
+            batched = await run(database, batcher.insert, writers, rounds)
+            print(f"NoteBatcher:         {batched:10.0f} inserts/s")
+            count = await database.fetch_val(
+                sqlalchemy.select([sqlalchemy.func.count()]).select_from(notes)
+            )
+            assert count == 2 * writers * rounds
+        finally:
+            await database.disconnect()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(*(int(arg) for arg in sys.argv[1:])))
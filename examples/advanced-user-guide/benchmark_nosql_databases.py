@@ -0,0 +1,62 @@
+"""
+Reading a user document per request, with the in-memory `FakeBucket` and a
+simulated network round trip:
+- `get_bucket per request`: open a new bucket (3 round trips) in every request,
+as `read_user` did before.
+- `BucketPool`: take an already opened bucket from the pool.
+
+`python benchmark_nosql_databases.py [requests] [rtt_ms] [threads]`
+"""
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from nosql_bucket_pool import BucketPool, fake_bucket_factory
+
+DOC_ID = "userprofile::alice"
+
+
+def per_request(factory):
+    def read(_):
+        bucket = factory()
+        return bucket.get(DOC_ID, quiet=True).value
+
+    return read
+
+
+def pooled(pool):
+    def read(_):
+        with pool.bucket() as bucket:
+            return bucket.get(DOC_ID, quiet=True).value
+
+    return read
+
+
+def run(read, requests: int, threads: int):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        values = list(executor.map(read, range(requests)))
+    elapsed = time.perf_counter() - start
+    assert all(value is not None for value in values)
+    return elapsed / requests * 1000, requests / elapsed
+
+
+def main(requests: int = 200, rtt_ms: float = 5.0, threads: int = 8):
+    factory = fake_bucket_factory(
+        {DOC_ID: {"username": "alice", "hashed_password": "x"}}, latency=rtt_ms / 1000
+    )
+    pool = BucketPool(factory, size=threads)
+    pool.open()
+    print(f"{requests} requests, {threads} threads, {rtt_ms:g} ms round trip")
+    for name, read in [
+        ("get_bucket per request", per_request(factory)),
+        ("BucketPool", pooled(pool)),
+    ]:
+        latency, throughput = run(read, requests, threads)
+        print(f"{name:<24} {latency:8.2f} ms/request {throughput:8.0f} requests/s")
+    pool.close()
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    main(*(type_(arg) for type_, arg in zip((int, float, int), args)))
@@ -0,0 +1,75 @@
+"""
+Resolving the users of one request, with the in-memory `FakeBucket` and a
+simulated network round trip (5 ms by default):
+- `get per user`: one `bucket.get()` per username, as `get_user()` does.
+- `DataLoader`: every username is `load()`ed at the same time, and they are
+read with a single, deduplicated `bucket.get_multi()`.
+
+Some of the usernames are repeated, as when several items have the same owner.
+
+Both use the functions of `nosql_databases.py`, `get_user()` and `get_users()`
+(and the loader of `get_user_loader()`), so the Couchbase SDK has to be
+installed, even though no server is used.
+
+`python benchmark_nosql_dataloader.py [users] [rtt_ms] [requests]`
+"""
+import asyncio
+import sys
+import time
+
+from starlette.concurrency import run_in_threadpool
+
+from nosql_bucket_pool import FakeBucket
+from nosql_databases import get_user, get_user_loader
+
+
+def doc_id(username: str) -> str:
+    return f"userprofile::{username}"
+
+
+async def get_per_user(bucket: FakeBucket, usernames):
+    return [await run_in_threadpool(get_user, bucket, name) for name in usernames]
+
+
+async def get_with_loader(bucket: FakeBucket, usernames):
+    loader = await get_user_loader(bucket)
+    return await loader.load_many(usernames)
+
+
+async def run(resolve, bucket: FakeBucket, usernames, requests: int):
+    latencies = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        users = await resolve(bucket, usernames)
+        latencies.append(time.perf_counter() - start)
+        assert len(users) == len(usernames)
+    latencies.sort()
+    return latencies[len(latencies) // 2] * 1000, latencies[-1] * 1000
+
+
+async def main(users: int = 50, rtt_ms: float = 5.0, requests: int = 10):
+    # half of the lookups are for a username that was already asked for
+    usernames = [f"user{i % (users // 2 or 1)}" for i in range(users)]
+    documents = {
+        doc_id(name): {"username": name, "hashed_password": "secret"}
+        for name in set(usernames)
+    }
+    print(
+        f"{users} lookups ({len(documents)} distinct) per request, "
+        f"{rtt_ms:g} ms round trip, {requests} requests"
+    )
+    for name, resolve in [
+        ("get per user", get_per_user),
+        ("DataLoader", get_with_loader),
+    ]:
+        bucket = FakeBucket(documents, latency=rtt_ms / 1000)
+        median, worst = await run(resolve, bucket, usernames, requests)
+        print(
+            f"{name:<14} median {median:8.2f} ms  max {worst:8.2f} ms  "
+            f"{bucket.calls // requests:4d} round trips/request"
+        )
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    asyncio.run(main(*(type_(arg) for type_, arg in zip((int, float, int), args))))
@@ -0,0 +1,84 @@
+"""
+Reading a deep page of open notes (`completed = false`) from 1M notes, in
+`async_SQL_Databases.py`:
+- `offset`: `WHERE completed = false ORDER BY id LIMIT 100 OFFSET <n>`
+- `keyset`: `WHERE completed = false AND id > <after> ORDER BY id LIMIT 100`,
+the query of `notes_page_query()`
+each with and without the index on `(completed, id)`.
+
+`python benchmark_notes_pagination.py [rows]`
+
+It uses its own SQLite file in a temporary directory, not `test.db`.
+"""
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+import sqlalchemy
+
+from async_SQL_Databases import metadata, notes, notes_page_query
+
+PAGE_SIZE = 100
+# most notes are completed, only a few are still open
+OPEN_RATIO = 0.01
+
+
+def median_ms(connection, query, repeat: int = 10):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        connection.execute(query).fetchall()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def main(rows: int = 1_000_000):
+    with tempfile.TemporaryDirectory() as directory:
+        url = "sqlite:///" + os.path.join(directory, "notes.db")
+        engine = sqlalchemy.create_engine(url)
+        metadata.create_all(engine)
+        random.seed(0)
+        with engine.begin() as connection:
+            connection.execute(
+                notes.insert(),
+                [
+                    {"text": f"Note {i}", "completed": random.random() > OPEN_RATIO}
+                    for i in range(rows)
+                ],
+            )
+        with engine.connect() as connection:
+            open_ids = [
+                row[0]
+                for row in connection.execute(
+                    sqlalchemy.select([notes.c.id])
+                    .where(notes.c.completed == False)  # noqa: E712
+                    .order_by(notes.c.id)
+                )
+            ]
+            print(f"{rows} notes, {len(open_ids)} open, page size {PAGE_SIZE}")
+            print(f"{'':<16} {'depth':>8} {'offset ms':>10} {'keyset ms':>10}")
+            for indexed in (False, True):
+                if not indexed:
+                    connection.execute("DROP INDEX ix_notes_completed_id")
+                else:
+                    connection.execute(
+                        "CREATE INDEX ix_notes_completed_id ON notes (completed, id)"
+                    )
+                connection.execute("ANALYZE")
+                for depth in (0, len(open_ids) // 2, len(open_ids) - PAGE_SIZE):
+                    after = open_ids[depth - 1] if depth else 0
+                    page = notes_page_query(completed=False, limit=PAGE_SIZE)
+                    offset = median_ms(connection, page.offset(depth))
+                    page = notes_page_query(
+                        completed=False, after=after, limit=PAGE_SIZE
+                    )
+                    keyset = median_ms(connection, page)
+                    label = "index" if indexed else "no index"
+                    print(f"{label:<16} {depth:>8} {offset:>10.2f} {keyset:>10.2f}")
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,62 @@
+"""
+Per-request overhead of the connection in `sql_app_peewee`: connecting and
+closing a `SqliteDatabase` on every request vs taking a connection from the
+`PooledSqliteDatabase` and giving it back (`SQL_APP_PEEWEE_POOLED=true`).
+
+`python benchmark_sql_app_peewee_pool.py [requests] [threads]`
+
+Each "request" does what the `get_db` dependency does around a small query:
+`db.connect()`, one `SELECT`, `db.close()`, from `threads` threads at the same
+time, like the threadpool. It uses its own SQLite file in a temporary
+directory, not `test.db`.
+"""
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import peewee
+from playhouse.pool import PooledSqliteDatabase
+
+from sql_app_peewee.database import PeeweeConnectionState, db_state, db_state_default
+
+
+def request(db):
+    # like `reset_db_state()` in `main.py`, each request gets its own state
+    db_state.set(db_state_default.copy())
+    db._state.reset()
+    db.connect()
+    try:
+        db.execute_sql("SELECT 1").fetchone()
+    finally:
+        db.close()
+
+
+def run(db, requests: int, threads: int) -> float:
+    db._state = PeeweeConnectionState()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        start = time.perf_counter()
+        list(executor.map(lambda _: request(db), range(requests)))
+        elapsed = time.perf_counter() - start
+    return elapsed / requests * 1_000_000
+
+
+def main(requests: int = 20000, threads: int = 8):
+    with tempfile.TemporaryDirectory() as directory:
+        name = os.path.join(directory, "test.db")
+        print(f"{requests} requests, {threads} threads")
+        unpooled = run(
+            peewee.SqliteDatabase(name, check_same_thread=False), requests, threads
+        )
+        print(f"connect and close per request: {unpooled:8.1f} µs/request")
+        pool = PooledSqliteDatabase(
+            name, check_same_thread=False, max_connections=threads, timeout=10
+        )
+        pooled = run(pool, requests, threads)
+        print(f"PooledSqliteDatabase:          {pooled:8.1f} µs/request")
+        pool.close_all()
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:]))
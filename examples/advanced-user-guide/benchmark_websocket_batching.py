@@ -0,0 +1,98 @@
+"""
+Pushing many small messages to one client, where each frame is a real write
+(`send()` system call) to a local socket:
+- `one frame per message`: `send_text()` for each message.
+- `BatchingWebSocket`: the messages within `max_delay` (or `max_bytes`) are
+sent together in one frame.
+
+Shows the throughput, the number of frames (writes), and how long the messages
+waited to be sent.
+
+`python benchmark_websocket_batching.py [messages] [max_delay_ms] [max_kb]`
+"""
+import asyncio
+import socket
+import struct
+import sys
+import threading
+import time
+
+from websocket_batching import BatchingWebSocket, FlushPolicy
+
+
+def frame_message(payload: bytes) -> bytes:
+    """A whole text frame, as the server builds it for each `send_text()`."""
+    length = len(payload)
+    if length < 126:
+        header = struct.pack("!BB", 0x81, length)
+    elif length < 2 ** 16:
+        header = struct.pack("!BBH", 0x81, 126, length)
+    else:
+        header = struct.pack("!BBQ", 0x81, 127, length)
+    return header + payload
+
+
+class SocketWebSocket:
+    """Writes each frame to a socket, a thread on the other side reads them."""
+
+    def __init__(self):
+        self.sock, self.peer = socket.socketpair()
+        self.frames = 0
+        self._reader = threading.Thread(target=self._drain, daemon=True)
+        self._reader.start()
+
+    def _drain(self):
+        while self.peer.recv(1 << 20):
+            pass
+
+    async def send_text(self, data: str):
+        self.sock.sendall(frame_message(data.encode()))
+        self.frames += 1
+
+    def close(self):
+        self.sock.close()
+
+
+async def push(websocket, messages: int):
+    message = '{"device": "sensor-1", "temperature": 21.5, "seq": %d}'
+    for i in range(messages):
+        await websocket.send_text(message % i)
+        # yield to the event loop, as an app doing other work between pushes
+        if i % 100 == 0:
+            await asyncio.sleep(0)
+
+
+async def main(messages: int = 100_000, max_delay_ms: float = 5.0, max_kb: int = 64):
+    print(f"{messages} messages, window {max_delay_ms:g} ms or {max_kb} KB")
+
+    websocket = SocketWebSocket()
+    start = time.perf_counter()
+    await push(websocket, messages)
+    elapsed = time.perf_counter() - start
+    print(
+        f"{'one frame per message':<22} {messages / elapsed:10.0f} messages/s "
+        f"{websocket.frames:8d} frames"
+    )
+    websocket.close()
+
+    raw = SocketWebSocket()
+    policy = FlushPolicy(max_delay=max_delay_ms / 1000, max_bytes=max_kb * 1024)
+    websocket = BatchingWebSocket(raw, policy)
+    start = time.perf_counter()
+    await push(websocket, messages)
+    await websocket.flush()
+    elapsed = time.perf_counter() - start
+    metrics = websocket.metrics()
+    print(
+        f"{'BatchingWebSocket':<22} {messages / elapsed:10.0f} messages/s "
+        f"{raw.frames:8d} frames  "
+        f"wait avg {metrics['average_wait'] * 1000:.2f} ms "
+        f"max {metrics['max_wait'] * 1000:.2f} ms"
+    )
+    raw.close()
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    types = (int, float, int)
+    asyncio.run(main(*(type_(arg) for type_, arg in zip(types, args))))
@@ -0,0 +1,98 @@
+"""
+Broadcasting one message to many simulated WebSocket clients, where each send
+takes `send_ms` and a few clients are very slow (their send takes `slow_ms`):
+- `one after the other`: the first `broadcast()`, `await`ing each send in turn.
+- `ConnectionManager`: concurrent sends, bounded to `max_concurrent_sends`,
+with a `send_timeout` that removes the slow clients.
+- `queued`: `ConnectionManager(queue_size=...)`, `broadcast()` only adds the
+message to each connection's queue, and the writer tasks send it.
+
+`python benchmark_websocket_broadcast.py [clients] [slow_clients] [send_ms] [slow_ms]`
+"""
+import asyncio
+import sys
+import time
+
+from websocket_manager import ConnectionManager
+
+
+class SimulatedWebSocket:
+    def __init__(self, delay: float):
+        self.delay = delay
+        self.received = 0
+
+    async def accept(self):
+        pass
+
+    async def send(self, message: dict):
+        await asyncio.sleep(self.delay)
+        self.received += 1
+
+    async def send_text(self, data: str):
+        await self.send({"type": "websocket.send", "text": data})
+
+
+async def one_after_the_other(connections, message: str):
+    for connection in connections:
+        await connection.send_text(message)
+
+
+async def main(
+    clients: int = 10_000,
+    slow_clients: int = 10,
+    send_ms: float = 0.1,
+    slow_ms: float = 500.0,
+):
+    def make_clients():
+        step = clients // slow_clients if slow_clients else clients + 1
+        return [
+            SimulatedWebSocket((slow_ms if i % step == 0 else send_ms) / 1000)
+            for i in range(clients)
+        ]
+
+    print(
+        f"{clients} clients ({slow_clients} slow), send {send_ms:g} ms, "
+        f"slow send {slow_ms:g} ms"
+    )
+
+    connections = make_clients()
+    start = time.perf_counter()
+    await one_after_the_other(connections, "hello")
+    elapsed = time.perf_counter() - start
+    print(f"{'one after the other':<20} {elapsed * 1000:10.1f} ms")
+
+    manager = ConnectionManager(max_concurrent_sends=100, send_timeout=0.05)
+    for connection in make_clients():
+        await manager.connect(connection)
+    start = time.perf_counter()
+    failed = await manager.broadcast("hello")
+    elapsed = time.perf_counter() - start
+    print(
+        f"{'ConnectionManager':<20} {elapsed * 1000:10.1f} ms "
+        f"({len(failed)} slow clients removed)"
+    )
+
+    # all the writers start at the same time, give them more time to send
+    manager = ConnectionManager(send_timeout=0.2, queue_size=100)
+    connections = make_clients()
+    for connection in connections:
+        await manager.connect(connection)
+    start = time.perf_counter()
+    await manager.broadcast("hello")
+    queued = time.perf_counter() - start
+    # until every client got the message or was removed
+    while manager.metrics()["sent"] < len(manager.active_connections):
+        await asyncio.sleep(0.001)
+    elapsed = time.perf_counter() - start
+    print(
+        f"{'queued':<20} {elapsed * 1000:10.1f} ms "
+        f"(broadcast() returned after {queued * 1000:.1f} ms)"
+    )
+    for connection in connections:
+        manager.disconnect(connection)
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    types = (int, int, float, float)
+    asyncio.run(main(*(type_(arg) for type_, arg in zip(types, args))))
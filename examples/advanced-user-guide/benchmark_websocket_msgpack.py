@@ -0,0 +1,65 @@
+"""
+JSON text frames against MessagePack binary frames, for telemetry-like
+messages (a few numbers, a timestamp, some tags):
+- the size of each message (what goes through the network),
+- the time to encode it, as `send_json()` does,
+- the time to decode it, as `receive_json()` does.
+
+`python benchmark_websocket_msgpack.py [messages]`
+"""
+import json
+import sys
+import time
+
+from websocket_msgpack import pack, unpack
+
+
+def telemetry(i: int):
+    return {
+        "device": f"sensor-{i % 100}",
+        "ts": 1_700_000_000.0 + i / 1000,
+        "seq": i,
+        "temperature": 21.5 + (i % 10) / 10,
+        "humidity": 40 + i % 20,
+        "voltage": 3.3,
+        "ok": True,
+        "tags": ["lab", "floor-2"],
+        "samples": [i % 7, i % 11, i % 13, i % 17],
+    }
+
+
+def json_encode(data):
+    # like Starlette's `send_json()`
+    return json.dumps(data).encode()
+
+
+def json_decode(data: bytes):
+    return json.loads(data.decode())
+
+
+def measure(func, items):
+    start = time.perf_counter()
+    results = [func(item) for item in items]
+    return time.perf_counter() - start, results
+
+
+def main(messages: int = 100_000):
+    data = [telemetry(i) for i in range(messages)]
+    print(f"{messages} telemetry messages")
+    for name, encode, decode in [
+        ("JSON", json_encode, json_decode),
+        ("MessagePack", pack, unpack),
+    ]:
+        encode_time, encoded = measure(encode, data)
+        decode_time, decoded = measure(decode, encoded)
+        assert decoded == data
+        size = sum(len(message) for message in encoded) / messages
+        print(
+            f"{name:<12} {size:6.1f} bytes/message  "
+            f"encode {encode_time / messages * 1e6:5.2f} us  "
+            f"decode {decode_time / messages * 1e6:5.2f} us"
+        )
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,78 @@
+"""
+The CPU time of a broadcast to many connections, with each message made once
+per connection (`send_text()`) vs once with a `PreparedMessage`, for two kinds
+of connections, both with an ASGI `send` that does nothing:
+
+- `asgi`: normal Starlette `WebSocket`s. The only thing saved is making a small
+`dict` per connection: the server still encodes and frames the text for each
+one (outside of this measurement), ASGI gives no way to share the frames.
+Expect about the same time in both cases.
+- `msgpack`: `CodecWebSocket`s that negotiated MessagePack. With `send_text()`
+each connection packs the text again, with a `PreparedMessage` it's packed once
+and every connection sends the same `bytes`.
+
+`python benchmark_websocket_prepared.py [clients] [repeat]`
+"""
+import asyncio
+import sys
+import time
+
+from starlette.websockets import WebSocket, WebSocketState
+
+from websocket_manager import PreparedMessage
+from websocket_msgpack import CodecWebSocket
+
+
+async def asgi_send(message: dict):
+    pass
+
+
+def asgi_websocket() -> WebSocket:
+    websocket = WebSocket({"type": "websocket"}, receive=None, send=asgi_send)
+    # as if `accept()` had been called
+    websocket.application_state = WebSocketState.CONNECTED
+    return websocket
+
+
+def msgpack_websocket() -> CodecWebSocket:
+    websocket = CodecWebSocket({"type": "websocket"}, receive=None, send=asgi_send)
+    websocket.application_state = WebSocketState.CONNECTED
+    websocket.binary = True
+    return websocket
+
+
+async def per_connection(connections, message: str):
+    for connection in connections:
+        await connection.send_text(message)
+
+
+async def prepared_once(connections, message: str):
+    prepared = PreparedMessage(message)
+    for connection in connections:
+        await prepared.send(connection)
+
+
+async def main(clients: int = 10_000, repeat: int = 5):
+    print(f"{clients} connections, best of {repeat}")
+    kinds = [("asgi", asgi_websocket), ("msgpack", msgpack_websocket)]
+    for kind, make_connection in kinds:
+        connections = [make_connection() for _ in range(clients)]
+        for size in [64, 4 * 1024, 64 * 1024]:
+            message = "é" * (size // 2)
+            for name, broadcast in [
+                ("per connection", per_connection),
+                ("PreparedMessage", prepared_once),
+            ]:
+                best = float("inf")
+                for _ in range(repeat):
+                    start = time.process_time()
+                    await broadcast(connections, message)
+                    best = min(best, time.process_time() - start)
+                print(
+                    f"{kind:<7} {size:>6} bytes  {name:<16} {best * 1000:9.2f} ms CPU"
+                )
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    asyncio.run(main(*(int(arg) for arg in args)))
@@ -0,0 +1,16 @@
+import asyncio
+
+import pytest
+
+
+@pytest.fixture
+def event_loop_for_client():
+    """The `TestClient` runs the app in the current event loop of the thread,
+    but the `@pytest.mark.asyncio` tests close theirs and leave none, so a test
+    with a `TestClient` that runs after them gets a new one, closed at the end.
+    """
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    yield loop
+    asyncio.set_event_loop(None)
+    loop.close()
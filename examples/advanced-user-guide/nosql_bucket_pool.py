@@ -0,0 +1,137 @@
+"""
+A pool of opened **Couchbase** buckets, and an in-memory stand-in for a bucket.
+
+`get_bucket()` in `nosql_databases.py` connects to the cluster, authenticates
+and opens the bucket. That's several network round trips, and if we call it in
+every request, we pay them in every request, before reading anything.
+
+Couchbase recommends not sharing a single `Bucket` between threads, and normal
+`def` *path operations* run in a threadpool. So instead of one shared bucket, we
+open a few of them when the app starts, keep them in a pool, and each request
+takes one from the pool (or waits until one is free), uses it, and gives it back.
+
+`FakeBucket` has the same `get`, `get_multi` and `upsert` methods as a bucket
+(the parts we use), but keeps the documents in a `dict`, and can wait `latency`
+seconds on each call to behave like a bucket on the network. With it, the pool
+and the code that uses it can be tested and benchmarked without a Couchbase
+server.
+"""
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, Optional
+
+
+class BucketPoolTimeout(Exception):
+    pass
+
+
+class BucketPool:
+    def __init__(
+        self, bucket_factory: Callable[[], Any], size: int = 4, timeout: float = 5.0
+    ):
+        self.bucket_factory = bucket_factory
+        self.size = size
+        self.timeout = timeout
+        self._buckets: "queue.LifoQueue" = queue.LifoQueue(maxsize=size)
+        self._opened = []
+        self._lock = threading.Lock()
+
+    def open(self):
+        """Open all the buckets, e.g. in a `startup` event handler."""
+        with self._lock:
+            while len(self._opened) < self.size:
+                bucket = self.bucket_factory()
+                self._opened.append(bucket)
+                self._buckets.put(bucket)
+
+    def close(self):
+        """Forget all the buckets, e.g. in a `shutdown` event handler.
+
+        Couchbase buckets close their connection when they are garbage
+        collected, but if a bucket has a `close()` method, we call it.
+        """
+        with self._lock:
+            while not self._buckets.empty():
+                self._buckets.get_nowait()
+            for bucket in self._opened:
+                close = getattr(bucket, "close", None)
+                if close is not None:
+                    close()
+            self._opened = []
+
+    @contextmanager
+    def bucket(self):
+        """Take a bucket from the pool, and give it back at the end of the
+        `with` block, even if there was an error.
+        """
+        try:
+            bucket = self._buckets.get(timeout=self.timeout)
+        except queue.Empty:
+            raise BucketPoolTimeout(f"No free bucket after {self.timeout} seconds")
+        try:
+            yield bucket
+        finally:
+            self._buckets.put(bucket)
+
+    @property
+    def available(self) -> int:
+        return self._buckets.qsize()
+
+
+class FakeResult:
+    def __init__(self, key: str, value: Optional[Any]):
+        self.key = key
+        self.value = value
+
+
+class FakeBucket:
+    """A bucket in memory. Every call waits `latency` seconds, as one round
+    trip to the server would. `calls` counts the round trips.
+    """
+    def __init__(
+        self, documents: Optional[Dict[str, Any]] = None, latency: float = 0.0
+    ):
+        self.documents = documents if documents is not None else {}
+        self.latency = latency
+        self.calls = 0
+
+    def _round_trip(self):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def get(self, key: str, quiet: bool = False):
+        self._round_trip()
+        if key not in self.documents and not quiet:
+            raise KeyError(key)
+        return FakeResult(key, self.documents.get(key))
+
+    def get_multi(self, keys: Iterable[str], quiet: bool = False):
+        """All the keys in a single round trip, as a `dict` of key to result."""
+        self._round_trip()
+        keys = list(keys)
+        missing = [key for key in keys if key not in self.documents]
+        if missing and not quiet:
+            raise KeyError(missing[0])
+        return {key: FakeResult(key, self.documents.get(key)) for key in keys}
+
+    def upsert(self, key: str, value: Any):
+        self._round_trip()
+        self.documents[key] = value
+        return FakeResult(key, value)
+
+
+def fake_bucket_factory(
+    documents: Dict[str, Any], latency: float = 0.0, connect_round_trips: int = 3
+):
+    """Create `FakeBucket`s that share the same `documents`, each one taking
+    `connect_round_trips` round trips to open (connect, authenticate, open the
+    bucket), like `get_bucket()`.
+    """
+    def factory():
+        time.sleep(latency * connect_round_trips)
+        return FakeBucket(documents, latency=latency)
+
+    return factory
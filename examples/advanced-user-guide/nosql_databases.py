@@ -1,12 +1,16 @@
 # importing couchbase components
-from typing import Optional
+from functools import partial
+from typing import List, Optional
 
 from couchbase import LOCKMODE_WAIT
 from couchbase.bucket import Bucket
 from couchbase.cluster import Cluster, PasswordAuthenticator
-from fastapi import FastAPI
+from fastapi import Depends, FastAPI, Query
 from pydantic import BaseModel
 
+from nosql_bucket_pool import BucketPool
+from nosql_dataloader import DataLoader
+
 USERPROFILE_DOC_TYPE = "userprofile"
 
 
@@ -79,17 +83,83 @@ def get_user(bucket: Bucket, username: str):
     return user
 
 
+def get_users(bucket: Bucket, usernames: List[str]) -> List[Optional[UserInDB]]:
+    """
+    The same as `get_user()`, but for many users, in a single round trip to the cluster with `bucket.get_multi()`.
+
+    It returns a user (or `None`) for each username, in the same order, that's what a `DataLoader` expects.
+    """
+    doc_ids = [f"userprofile::{username}" for username in usernames]
+    results = bucket.get_multi(doc_ids, quiet=True)
+    users = []
+    for doc_id in doc_ids:
+        result = results.get(doc_id)
+        users.append(UserInDB(**result.value) if result and result.value else None)
+    return users
+
+
 # FastAPI specific code
 app = FastAPI()
 
+"""
+Opening a bucket takes several round trips to the cluster, so instead of
+calling `get_bucket()` in each request, we open a few buckets at startup and
+keep them in a `BucketPool` (see `nosql_bucket_pool.py`).
+
+The *path operations* get the pool with the `get_bucket_pool` dependency, so the
+tests can give them another one, e.g. with `FakeBucket`s:
+
+    app.dependency_overrides[get_bucket_pool] = lambda: fake_pool
+"""
+bucket_pool = BucketPool(get_bucket, size=4)
+
+
+def get_bucket_pool() -> BucketPool:
+    return bucket_pool
+
+
+@app.on_event("startup")
+def open_bucket_pool():
+    bucket_pool.open()
+
+
+@app.on_event("shutdown")
+def close_bucket_pool():
+    bucket_pool.close()
+
+
+def get_pooled_bucket(pool: BucketPool = Depends(get_bucket_pool)):
+    """A dependency that takes a bucket from the pool for the request, and gives
+    it back when the request is done.
+    """
+    with pool.bucket() as bucket:
+        yield bucket
+
 
 @app.get("/users/{username}", response_model=User)
-def read_user(username: str):
+def read_user(username: str, bucket: Bucket = Depends(get_pooled_bucket)):
     """As our code is calling Couchbase and we are not using the experimental Python `await` support, we should declare our function with normal `def` instead of `async def`.
 
-    Also, Couchbase recommends not using a single `Bucket` object in multiple "threads", so, we can just get the bucket directly and pass it to our utility functions
+    Also, Couchbase recommends not using a single `Bucket` object in multiple "threads", so each request gets its own bucket from the pool, that no other request uses at the same time, and we pass it to our utility functions
     """
-    bucket = get_bucket()
     user = get_user(bucket=bucket, username=username)
     return user
 
+
+async def get_user_loader(bucket: Bucket = Depends(get_pooled_bucket)):
+    """A new `DataLoader` for each request, so the users it read are only shared inside the request.
+    It's an `async def` dependency, to create the loader in the event loop of the request.
+    """
+    return DataLoader(partial(get_users, bucket))
+
+
+@app.get("/users/", response_model=List[Optional[User]])
+async def read_users(
+    usernames: List[str] = Query(...), loader: DataLoader = Depends(get_user_loader)
+):
+    """All the `loader.load()` calls started here run in the same tick of the event loop, so all the users
+    are read with a single `get_multi()`, and a username that is repeated is only read once.
+
+    The code that resolves each user doesn't need to know about the others, it just calls `loader.load()`.
+    """
+    return await loader.load_many(usernames)
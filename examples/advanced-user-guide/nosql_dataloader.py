@@ -0,0 +1,79 @@
+"""
+Batching the lookups of a request, like a GraphQL "DataLoader".
+
+`get_user()` in `nosql_databases.py` does one `bucket.get()`, that's one round
+trip to **Couchbase** per user. When a request needs many users, those round
+trips add up, one after the other.
+
+A `DataLoader` is created for each request, and `await loader.load(key)` doesn't
+read anything right away. It only remembers the key, and all the keys asked for
+in the same "tick" of the event loop (e.g. all the `load()` calls started by one
+`asyncio.gather()`) are read together, with a single call to `batch_load_fn`
+(e.g. one `bucket.get_multi()`). Each key is only read once: a repeated key
+gets the same result, also in later ticks of the same request.
+
+`batch_load_fn` is a normal (blocking) function that receives a list of keys
+and returns a list with a value for each key, in the same order. As it blocks,
+it runs in the threadpool, and batches of the same loader run one at a time, so
+the bucket of the request is never used by two threads at once.
+"""
+import asyncio
+from typing import Callable, Dict, Hashable, Iterable, List, Set
+
+from starlette.concurrency import run_in_threadpool
+
+
+class DataLoader:
+    def __init__(self, batch_load_fn: Callable[[List[Hashable]], List]):
+        self.batch_load_fn = batch_load_fn
+        self.batches = 0
+        self._pending: Dict[Hashable, asyncio.Future] = {}
+        self._results: Dict[Hashable, asyncio.Future] = {}
+        # the batches being read, the event loop only keeps weak references to
+        # the tasks
+        self._tasks: Set[asyncio.Task] = set()
+        self._lock = asyncio.Lock()
+
+    async def load(self, key: Hashable):
+        future = self._results.get(key)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = self._results[key] = loop.create_future()
+            if not self._pending:
+                # the first key of this tick, read them all after the other
+                # coroutines that are ready had the chance to add their keys
+                loop.call_soon(self._dispatch)
+            self._pending[key] = future
+        # `shield`, so that if one caller is cancelled, the others sharing the
+        # same key still get the value
+        return await asyncio.shield(future)
+
+    async def load_many(self, keys: Iterable[Hashable]) -> List:
+        return await asyncio.gather(*(self.load(key) for key in keys))
+
+    def _dispatch(self):
+        batch, self._pending = self._pending, {}
+        task = asyncio.ensure_future(self._load_batch(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _load_batch(self, batch: Dict[Hashable, asyncio.Future]):
+        keys = list(batch)
+        try:
+            async with self._lock:
+                self.batches += 1
+                values = await run_in_threadpool(self.batch_load_fn, keys)
+            if len(values) != len(keys):
+                raise ValueError(
+                    f"batch_load_fn returned {len(values)} values for {len(keys)} keys"
+                )
+        except Exception as exc:
+            for key, future in batch.items():
+                # don't keep the error, a later `load()` can try again
+                self._results.pop(key, None)
+                if not future.done():
+                    future.set_exception(exc)
+            return
+        for future, value in zip(batch.values(), values):
+            if not future.done():
+                future.set_result(value)
@@ -0,0 +1,23 @@
+"""Settings for the Peewee `sql_app`, read from environment variables with the
+`SQL_APP_PEEWEE_` prefix, e.g. `SQL_APP_PEEWEE_POOLED=true`.
+"""
+from pydantic import BaseSettings
+
+
+class Settings(BaseSettings):
+    database_name: str = "test.db"
+    # keep the connections open in a pool instead of connecting and closing
+    # them on every request (see `database.py`)
+    pooled: bool = False
+    # maximum number of connections open at the same time
+    max_connections: int = 8
+    # seconds after which an idle connection is closed instead of being reused
+    stale_timeout: int = 300
+    # seconds to wait for a free connection when all of them are in use
+    wait_timeout: int = 10
+
+    class Config:
+        env_prefix = "SQL_APP_PEEWEE_"
+
+
+settings = Settings()
@@ -16,8 +16,11 @@ We are going to override the internal parts of Peewee that use `threading.local`
 from contextvars import ContextVar
 
 import peewee
+from playhouse.pool import PooledSqliteDatabase
 
-DATABASE_NAME = "test.db"
+from .config import settings
+
+DATABASE_NAME = settings.database_name
 db_state_default = {"closed": None, "conn": None, "ctx": None, "transactions": None}
 db_state = ContextVar("db_state", default=db_state_default.copy())
 
@@ -47,8 +50,35 @@ The argument:
 is equivalent to the one in the SQLAlchemy:
 `connect_args={"check_same_thread": False}`
 ...it is needed only for `SQLite`.
+
+With `SQL_APP_PEEWEE_POOLED=true` we use a pool of connections that stay open
+between requests.
+
+`PooledSqliteDatabase` keeps the connection being used by each "thread" in the
+database state, that here is our `PeeweeConnectionState`, so each request still
+gets its own connection. `db.connect()` takes one from the pool (or opens a new
+one) and `db.close()` gives it back to the pool instead of closing it. Peewee
+already does both while holding its own lock, so the requests running in
+different threads of the threadpool can share the pool.
+
+`benchmark_sql_app_peewee_pool.py` measures how much that saves per request.
+
+The pool settings:
+- `max_connections`: at most this many connections are open at the same time.
+- `stale_timeout`: connections idle for longer than this are closed, not reused.
+- `timeout`: when all the connections are in use, `connect()` waits up to this
+many seconds for one to be given back, instead of failing right away.
 """
-db = peewee.SqliteDatabase(DATABASE_NAME, check_same_thread=False)
+if settings.pooled:
+    db = PooledSqliteDatabase(
+        DATABASE_NAME,
+        check_same_thread=False,
+        max_connections=settings.max_connections,
+        stale_timeout=settings.stale_timeout,
+        timeout=settings.wait_timeout,
+    )
+else:
+    db = peewee.SqliteDatabase(DATABASE_NAME, check_same_thread=False)
 
 # overwriting the `._state` internal attribute in the Peewee database `db` object using the new `PeeweeConnectionState`
 db._state = PeeweeConnectionState()
@@ -0,0 +1,106 @@
+"""
+Running slow *path operations* in their own, limited, threadpool.
+
+FastAPI runs every normal `def` *path operation* (and dependency) in the same
+threadpool. If a slow one (like `read_slow_users`, that sleeps for several
+seconds) is called many times at once, it can take all the threads of that pool,
+and then all the other *path operations* have to wait for a free thread too,
+even if they would be very fast.
+
+With `@slow_executor.route`, the *path operation* runs in the threads of
+`slow_executor` instead. At most `max_workers` of those requests run at the
+same time, at most `max_queue` more wait for a thread, and any other request
+gets a `503 Service Unavailable` response right away. The shared threadpool is
+never used by them.
+
+Each `RouteExecutor` also counts how many requests are running, waiting, and
+were rejected (see `metrics()`).
+"""
+import asyncio
+import contextvars
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict
+
+from fastapi import HTTPException
+
+executors: Dict[str, "RouteExecutor"] = {}
+
+
+class RouteExecutor:
+    def __init__(self, name: str, max_workers: int, max_queue: int):
+        self.name = name
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.running = 0
+        self.queued = 0
+        self.completed = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix=f"route-{name}"
+        )
+        executors[name] = self
+
+    @property
+    def capacity(self):
+        return self.max_workers + self.max_queue
+
+    def route(self, func):
+        """Decorate a normal `def` *path operation function* to run it here.
+
+        The new function is `async def`, so FastAPI doesn't send it to its own
+        threadpool, and it has the same signature (`functools.wraps`), so
+        FastAPI still sees the same parameters.
+
+        As with FastAPI's threadpool, the function runs with a copy of the
+        current "context", so it sees the same `contextvars` values (like the
+        Peewee database state of the request).
+        """
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with self._lock:
+                if self.running + self.queued >= self.capacity:
+                    self.rejected += 1
+                    raise HTTPException(status_code=503, detail="Server busy")
+                self.queued += 1
+            context = contextvars.copy_context()
+            call = functools.partial(context.run, self._run, func, *args, **kwargs)
+            future = self._executor.submit(call)
+            try:
+                return await asyncio.wrap_future(future)
+            except asyncio.CancelledError:
+                # the client went away, if it was still waiting it won't run
+                if future.cancelled() or future.cancel():
+                    with self._lock:
+                        self.queued -= 1
+                raise
+
+        return wrapper
+
+    def _run(self, func, *args, **kwargs):
+        with self._lock:
+            self.queued -= 1
+            self.running += 1
+        try:
+            return func(*args, **kwargs)
+        finally:
+            with self._lock:
+                self.running -= 1
+                self.completed += 1
+
+    def metrics(self):
+        with self._lock:
+            return {
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "running": self.running,
+                "queue_depth": self.queued,
+                "saturation": self.running / self.max_workers,
+                "completed": self.completed,
+                "rejected": self.rejected,
+            }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
@@ -5,6 +5,7 @@ from fastapi import Depends, FastAPI, HTTPException
 
 from . import crud, database, models, schemas
 from .database import db_state_default
+from .executors import RouteExecutor, executors
 
 database.db.connect()
 database.db.create_tables([models.User, models.Item])
@@ -14,6 +15,15 @@ app = FastAPI()
 
 sleep_time = 10
 
+# at most 4 slow requests at a time, 16 more waiting, the rest get a `503`
+slow_executor = RouteExecutor("slow", max_workers=4, max_queue=16)
+
+
+@app.on_event("shutdown")
+def shutdown_executors():
+    for executor in executors.values():
+        executor.shutdown()
+
 
 async def reset_db_state():
     """
@@ -101,18 +111,40 @@ def create_item_for_user(user_id: int, item: schemas.ItemCreate):
 @app.get("/items/", response_model=List[schemas.Item], dependencies=[Depends(get_db)])
 def read_items(skip: int = 0, limit: int = 100):
     items = crud.get_items(skip=skip, limit=limit)
-    return get_items
+    return items
 
 
 @app.get(
-    "/slowusers/", response_model=List[schemas.User], dependencies=[Depends(get_db)]
+    "/slowusers/",
+    response_model=List[schemas.User],
+    dependencies=[Depends(reset_db_state)],
 )
+@slow_executor.route
 def read_slow_users(skip: int = 0, limit: int = 100):
+    """
+    This one runs in the threads of `slow_executor` (see `executors.py`).
+
+    It doesn't use `get_db()`, as that would take a connection in FastAPI's
+    threadpool even while the request is still waiting for a thread of
+    `slow_executor`. Instead, the connection is opened and closed here, with
+    `connection_context()`, and the users are converted to `schemas.User` (which
+    reads their `items` from the database) before it's closed.
+
+    The slow part runs before the connection is opened, so the connection is
+    only taken (from the pool) for the time of the queries.
+    """
     global sleep_time
     sleep_time = max(0, sleep_time - 1)
     time.sleep(sleep_time) # Fake long processing request
-    users = crud.get_users(skip=skip, limit=limit)
-    return users
+    with database.db.connection_context():
+        users = crud.get_users(skip=skip, limit=limit)
+        return [schemas.User.from_orm(user) for user in users]
+
+
+@app.get("/executors/")
+def read_executors():
+    """How busy are the threadpools of the slow *path operations*."""
+    return {name: executor.metrics() for name, executor in executors.items()}
 
 """ABOUT def VS async def
 The same as with SQLAlchemy, we are not doing something like:
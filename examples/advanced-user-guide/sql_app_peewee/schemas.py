@@ -38,7 +38,7 @@ class PeeweeGetterDict(GetterDict):
     """
     def get(self, key: Any, default: Any = None):
         res = getattr(self._obj, key, default)
-        if isinstane(res, peewee.ModelSelect):
+        if isinstance(res, peewee.ModelSelect):
             return list(res)
         return res
 
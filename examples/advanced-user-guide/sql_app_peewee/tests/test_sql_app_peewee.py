@@ -0,0 +1,100 @@
+"""
+Testing the Peewee app with the pool of connections.
+
+The settings are read when `database.py` is imported, so the environment
+variables are set before importing the app. The testing database is a new file
+in a temporary directory.
+"""
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+directory = tempfile.TemporaryDirectory()
+os.environ["SQL_APP_PEEWEE_DATABASE_NAME"] = os.path.join(
+    directory.name, "test.db"
+)
+os.environ["SQL_APP_PEEWEE_POOLED"] = "true"
+os.environ["SQL_APP_PEEWEE_MAX_CONNECTIONS"] = "4"
+
+from fastapi.testclient import TestClient  # noqa: E402
+from playhouse.pool import PooledSqliteDatabase  # noqa: E402
+
+from .. import database, main  # noqa: E402
+
+client = TestClient(main.app)
+
+
+def test_create_user():
+    response = client.post(
+        "/users/", json={"email": "pooled@example.com", "password": "secret"}
+    )
+    assert response.status_code == 200, response.text
+    user_id = response.json()["id"]
+
+    response = client.get(f"/users/{user_id}")
+    assert response.status_code == 200, response.text
+    assert response.json()["email"] == "pooled@example.com"
+
+
+def test_concurrent_slow_users(monkeypatch):
+    """Ten concurrent requests to `/slowusers/`, as in the explanation at the end of
+    `main.py`, all succeed and share at most `max_connections` connections.
+    """
+    # each "second" of `sleep_time` is 10 ms here
+    fast_time = SimpleNamespace(sleep=lambda seconds: time.sleep(seconds / 100))
+    monkeypatch.setattr(main, "time", fast_time)
+    monkeypatch.setattr(main, "sleep_time", 10)
+
+    with ThreadPoolExecutor(max_workers=10) as executor:
+        responses = list(
+            executor.map(lambda _: client.get("/slowusers/"), range(10))
+        )
+
+    assert [response.status_code for response in responses] == [200] * 10
+    # the connections were given back to the pool and reused, instead of
+    # opening and closing one per request
+    pool = database.db
+    assert isinstance(pool, PooledSqliteDatabase)
+    assert pool._in_use == {}
+    assert 1 <= len(pool._connections) <= 4
+
+
+def test_slow_users_executor_is_bounded(monkeypatch):
+    """More slow requests than `slow_executor` accepts get a `503`, while the
+    other *path operations* keep working.
+    """
+    fast_time = SimpleNamespace(sleep=lambda seconds: time.sleep(0.2))
+    monkeypatch.setattr(main, "time", fast_time)
+    executor = main.slow_executor
+    capacity = executor.capacity
+
+    with ThreadPoolExecutor(max_workers=capacity + 5) as threads:
+        slow = [
+            threads.submit(client.get, "/slowusers/") for _ in range(capacity + 5)
+        ]
+        time.sleep(0.1)
+        metrics = client.get("/executors/").json()["slow"]
+        assert client.get("/users/1").status_code == 200
+        statuses = [future.result().status_code for future in slow]
+
+    assert metrics["running"] == executor.max_workers
+    assert metrics["saturation"] == 1.0
+    assert statuses.count(200) == capacity
+    assert statuses.count(503) == 5
+    metrics = client.get("/executors/").json()["slow"]
+    assert (metrics["running"], metrics["queue_depth"]) == (0, 0)
+    assert metrics["rejected"] == 5
+
+
+def test_slow_users_sleep_without_a_connection(monkeypatch):
+    connections_in_use = []
+
+    def sleep(seconds):
+        connections_in_use.append(len(database.db._in_use))
+
+    monkeypatch.setattr(main, "time", SimpleNamespace(sleep=sleep))
+    response = client.get("/slowusers/")
+    assert response.status_code == 200, response.text
+    assert connections_in_use == [0]
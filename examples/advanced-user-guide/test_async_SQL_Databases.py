@@ -0,0 +1,149 @@
+import asyncio
+import json
+
+import databases
+import pytest
+import sqlalchemy
+from fastapi.testclient import TestClient
+
+import async_SQL_Databases
+from async_SQL_Databases import (
+    NoteBatcher,
+    NoteIn,
+    iterate_json_array,
+    metadata,
+    notes,
+    notes_page_query,
+)
+
+
+@pytest.mark.asyncio
+async def test_note_batcher(tmp_path):
+    # using a new database file, not `test.db`
+    url = f"sqlite:///{tmp_path / 'notes.db'}"
+    metadata.create_all(sqlalchemy.create_engine(url))
+    database = databases.Database(url)
+    await database.connect()
+    batcher = NoteBatcher(database, max_rows=10)
+    batch_sizes = []
+    insert_batch = batcher._insert_batch
+
+    async def record_batch(rows):
+        batch_sizes.append(len(rows))
+        return await insert_batch(rows)
+
+    batcher._insert_batch = record_batch
+
+    # 25 notes at the same time are saved in 3 batches: 10, 10 and 5
+    new_notes = [NoteIn(text=f"Note {i}", completed=i % 2 == 0) for i in range(25)]
+    ids = await asyncio.gather(*(batcher.insert(note) for note in new_notes))
+    assert batch_sizes == [10, 10, 5]
+
+    rows = await database.fetch_all(notes.select())
+    await database.disconnect()
+    assert len(set(ids)) == 25
+    # each caller got the `id` of its own note
+    assert {row["id"]: row["text"] for row in rows} == {
+        note_id: f"Note {i}" for i, note_id in enumerate(ids)
+    }
+
+
+@pytest.mark.asyncio
+async def test_note_batcher_caller_cancelled(tmp_path):
+    url = f"sqlite:///{tmp_path / 'notes.db'}"
+    metadata.create_all(sqlalchemy.create_engine(url))
+    database = databases.Database(url)
+    await database.connect()
+    batcher = NoteBatcher(database, max_rows=3)
+
+    new_notes = [NoteIn(text=f"Note {i}", completed=False) for i in range(3)]
+    first = [asyncio.ensure_future(batcher.insert(note)) for note in new_notes[:2]]
+    await asyncio.sleep(0)
+    # the third note fills the batch, and its request is cancelled right away
+    last = asyncio.ensure_future(batcher.insert(new_notes[2]))
+    await asyncio.sleep(0)
+    last.cancel()
+
+    ids = await asyncio.wait_for(asyncio.gather(*first), timeout=5)
+    count = await database.fetch_val(
+        sqlalchemy.select([sqlalchemy.func.count()]).select_from(notes)
+    )
+    await database.disconnect()
+    assert len(set(ids)) == 2
+    assert count == 3
+
+
+@pytest.mark.asyncio
+async def test_iterate_json_array(tmp_path):
+    url = f"sqlite:///{tmp_path / 'notes.db'}"
+    metadata.create_all(sqlalchemy.create_engine(url))
+    database = databases.Database(url)
+    await database.connect()
+    await database.execute_many(
+        notes.insert(), [{"text": f"Note {i}", "completed": False} for i in range(50)]
+    )
+
+    stream = iterate_json_array(database, notes.select(), chunk_size=100)
+    chunks = [chunk async for chunk in stream]
+    expected = [dict(row) for row in await database.fetch_all(notes.select())]
+    await database.disconnect()
+    assert chunks[0] == "["
+    assert all(len(chunk) < 200 for chunk in chunks)
+    assert json.loads("".join(chunks)) == expected
+
+
+@pytest.mark.asyncio
+async def test_notes_page_query(tmp_path):
+    url = f"sqlite:///{tmp_path / 'notes.db'}"
+    metadata.create_all(sqlalchemy.create_engine(url))
+    database = databases.Database(url)
+    await database.connect()
+    await database.execute_many(
+        notes.insert(),
+        [{"text": f"Note {i}", "completed": i % 3 == 0} for i in range(30)],
+    )
+
+    pages = []
+    after = None
+    while True:
+        query = notes_page_query(completed=False, after=after, limit=7)
+        page = await database.fetch_all(query)
+        if not page:
+            break
+        pages.append([row["text"] for row in page])
+        after = page[-1]["id"]
+    await database.disconnect()
+    assert [len(page) for page in pages] == [7, 7, 6]
+    assert sum(pages, []) == [f"Note {i}" for i in range(30) if i % 3 != 0]
+
+
+def test_read_notes_pages(tmp_path, monkeypatch, event_loop_for_client):
+    url = f"sqlite:///{tmp_path / 'notes.db'}"
+    engine = sqlalchemy.create_engine(url)
+    metadata.create_all(engine)
+    with engine.begin() as connection:
+        # as in a database made before the index was added
+        connection.exec_driver_sql("DROP INDEX ix_notes_completed_id")
+        connection.execute(
+            notes.insert(),
+            [{"text": f"Note {i}", "completed": False} for i in range(250)],
+        )
+    monkeypatch.setattr(async_SQL_Databases, "database", databases.Database(url))
+
+    with TestClient(async_SQL_Databases.app) as client:
+        response = client.get("/notes/")
+        assert response.status_code == 200, response.text
+        # a bounded page by default, with the cursor of the next one
+        assert len(response.json()) == 100
+        texts = [note["text"] for note in response.json()]
+        while "X-Next-Cursor" in response.headers:
+            after = response.headers["X-Next-Cursor"]
+            response = client.get("/notes/", params={"after": after})
+            texts += [note["text"] for note in response.json()]
+        assert client.get("/notes/", params={"limit": 1001}).status_code == 422
+    assert texts == [f"Note {i}" for i in range(250)]
+    # the startup created the missing index
+    with engine.connect() as connection:
+        assert connection.exec_driver_sql(
+            "SELECT 1 FROM sqlite_master WHERE name = 'ix_notes_completed_id'"
+        ).first()
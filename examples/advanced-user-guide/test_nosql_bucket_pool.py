@@ -0,0 +1,69 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from nosql_bucket_pool import (
+    BucketPool,
+    BucketPoolTimeout,
+    FakeBucket,
+    fake_bucket_factory,
+)
+
+
+def test_fake_bucket():
+    bucket = FakeBucket({"userprofile::alice": {"username": "alice"}})
+    assert bucket.get("userprofile::alice").value == {"username": "alice"}
+    assert bucket.get("userprofile::bob", quiet=True).value is None
+    with pytest.raises(KeyError):
+        bucket.get("userprofile::bob")
+    results = bucket.get_multi(["userprofile::alice", "userprofile::bob"], quiet=True)
+    assert results["userprofile::bob"].value is None
+    assert bucket.calls == 4
+
+
+def test_bucket_pool_reuses_buckets():
+    opened = []
+    documents = {"userprofile::alice": {"username": "alice"}}
+    factory = fake_bucket_factory(documents)
+
+    def bucket_factory():
+        opened.append(factory())
+        return opened[-1]
+
+    pool = BucketPool(bucket_factory, size=3)
+    pool.open()
+    in_use = set()
+    lock = threading.Lock()
+
+    def read(_):
+        with pool.bucket() as bucket:
+            with lock:
+                # no two requests use the same bucket at the same time
+                assert id(bucket) not in in_use
+                in_use.add(id(bucket))
+            value = bucket.get("userprofile::alice", quiet=True).value
+            with lock:
+                in_use.remove(id(bucket))
+            return value
+
+    with ThreadPoolExecutor(max_workers=10) as executor:
+        values = list(executor.map(read, range(100)))
+
+    assert values == [{"username": "alice"}] * 100
+    assert len(opened) == 3
+    assert sum(bucket.calls for bucket in opened) == 100
+    assert pool.available == 3
+    pool.close()
+    assert pool.available == 0
+
+
+def test_bucket_pool_timeout():
+    pool = BucketPool(FakeBucket, size=1, timeout=0.01)
+    pool.open()
+    with pool.bucket():
+        with pytest.raises(BucketPoolTimeout):
+            with pool.bucket():
+                pass
+    # the bucket was given back
+    assert pool.available == 1
@@ -0,0 +1,54 @@
+import pytest
+
+pytest.importorskip("couchbase")
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+from nosql_bucket_pool import BucketPool, FakeBucket  # noqa: E402
+from nosql_databases import app, get_bucket_pool, get_users  # noqa: E402
+
+DOCUMENTS = {
+    f"userprofile::{name}": {"username": name, "hashed_password": "secret"}
+    for name in ("alice", "bob")
+}
+
+
+@pytest.fixture
+def bucket():
+    bucket = FakeBucket(DOCUMENTS)
+    pool = BucketPool(lambda: bucket, size=1)
+    pool.open()
+    app.dependency_overrides[get_bucket_pool] = lambda: pool
+    yield bucket
+    app.dependency_overrides.clear()
+
+
+def test_get_users():
+    bucket = FakeBucket(DOCUMENTS)
+    users = get_users(bucket, ["bob", "nobody", "alice"])
+    assert [user and user.username for user in users] == ["bob", None, "alice"]
+    assert bucket.calls == 1
+
+
+def test_read_user(bucket):
+    # without `with`, the startup event doesn't open the real pool
+    client = TestClient(app)
+    response = client.get("/users/alice")
+    assert response.status_code == 200, response.text
+    assert response.json()["username"] == "alice"
+    assert "hashed_password" not in response.json()
+
+
+def test_read_users_in_one_round_trip(bucket):
+    client = TestClient(app)
+    response = client.get(
+        "/users/", params={"usernames": ["alice", "nobody", "bob", "alice"]}
+    )
+    assert response.status_code == 200, response.text
+    assert [user and user["username"] for user in response.json()] == [
+        "alice",
+        None,
+        "bob",
+        "alice",
+    ]
+    assert bucket.calls == 1
@@ -0,0 +1,53 @@
+import asyncio
+
+import pytest
+
+from nosql_bucket_pool import FakeBucket
+from nosql_dataloader import DataLoader
+
+
+def make_loader(bucket: FakeBucket):
+    def get_documents(keys):
+        results = bucket.get_multi(keys, quiet=True)
+        return [results[key].value for key in keys]
+
+    return DataLoader(get_documents)
+
+
+@pytest.mark.asyncio
+async def test_same_tick_lookups_are_batched_and_deduplicated():
+    bucket = FakeBucket({"a": 1, "b": 2, "c": 3})
+    loader = make_loader(bucket)
+
+    values = await asyncio.gather(
+        loader.load("a"), loader.load("b"), loader.load("a"), loader.load("missing")
+    )
+    assert values == [1, 2, 1, None]
+    assert bucket.calls == 1
+
+    # already read in this request, no new round trip
+    assert await loader.load_many(["b", "a"]) == [2, 1]
+    assert bucket.calls == 1
+
+    assert await loader.load_many(["c", "b"]) == [3, 2]
+    assert bucket.calls == 2
+    assert loader.batches == 2
+
+
+@pytest.mark.asyncio
+async def test_errors_reach_every_caller_and_are_not_kept():
+    fail = True
+
+    def batch_load(keys):
+        if fail:
+            raise ConnectionError("cluster unavailable")
+        return [key.upper() for key in keys]
+
+    loader = DataLoader(batch_load)
+    results = await asyncio.gather(
+        loader.load("a"), loader.load("b"), return_exceptions=True
+    )
+    assert all(isinstance(result, ConnectionError) for result in results)
+
+    fail = False
+    assert await loader.load("a") == "A"
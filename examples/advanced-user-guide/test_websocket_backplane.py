@@ -0,0 +1,137 @@
+import asyncio
+
+import pytest
+
+from test_websocket_manager import FakeWebSocket
+from websocket_backplane import (
+    HEADER,
+    UnixSocketBackplane,
+    UnixSocketBroker,
+    encode_frame,
+)
+from websocket_manager import ConnectionManager
+
+
+async def wait_for_messages(websocket: FakeWebSocket, count: int):
+    for _ in range(100):
+        if len(websocket.messages) >= count:
+            return
+        await asyncio.sleep(0.01)
+
+
+@pytest.mark.asyncio
+async def test_messages_reach_the_other_workers(tmp_path):
+    path = str(tmp_path / "chat.sock")
+    # three "workers", in the same process, each with its own manager
+    managers = [
+        ConnectionManager(backplane=UnixSocketBackplane(path, reconnect_delay=0.01))
+        for _ in range(3)
+    ]
+    clients = []
+    for manager in managers:
+        await manager.start()
+        websocket = FakeWebSocket()
+        await manager.connect(websocket)
+        manager.join(websocket, "foo" if manager is managers[2] else "bar")
+        clients.append(websocket)
+    # only one of them runs the broker
+    assert [manager.backplane.broker is not None for manager in managers] == [
+        True,
+        False,
+        False,
+    ]
+    # `start()` returns once the broker accepted the worker
+    assert len(managers[0].backplane.broker.writers) == 3
+
+    await managers[1].broadcast("hello")
+    await managers[0].publish("foo", "to foo")
+    for websocket in clients:
+        await wait_for_messages(websocket, 2 if websocket is clients[2] else 1)
+
+    assert clients[0].messages == ["hello"]
+    assert clients[1].messages == ["hello"]
+    assert clients[2].messages == ["hello", "to foo"]
+    # published once by each worker, received once by each of the others
+    assert [manager.backplane.published for manager in managers] == [1, 1, 0]
+    assert [manager.backplane.received for manager in managers] == [1, 1, 2]
+
+    for manager in managers:
+        await manager.stop()
+
+
+@pytest.mark.asyncio
+async def test_another_worker_takes_over_the_broker(tmp_path):
+    path = str(tmp_path / "chat.sock")
+    first = ConnectionManager(backplane=UnixSocketBackplane(path, reconnect_delay=0.01))
+    second = ConnectionManager(backplane=UnixSocketBackplane(path, reconnect_delay=0.01))
+    third = ConnectionManager(backplane=UnixSocketBackplane(path, reconnect_delay=0.01))
+    await first.start()
+    await second.start()
+    await third.start()
+    websocket = FakeWebSocket()
+    await third.connect(websocket)
+
+    await first.stop()
+    # one of the others takes over, and the other one reconnects to it
+    for _ in range(100):
+        broker = second.backplane.broker or third.backplane.broker
+        if broker and len(broker.writers) == 2:
+            break
+        await asyncio.sleep(0.01)
+    assert len(broker.writers) == 2
+
+    await second.broadcast("still here")
+    await wait_for_messages(websocket, 1)
+    assert websocket.messages == ["still here"]
+
+    await second.stop()
+    await third.stop()
+
+
+@pytest.mark.asyncio
+async def test_broker_drops_a_worker_that_does_not_read(tmp_path):
+    path = str(tmp_path / "chat.sock")
+    broker = UnixSocketBroker(path, drain_timeout=0.1)
+    await broker.start()
+    sender_reader, sender = await asyncio.open_unix_connection(path)
+    stuck_reader, stuck = await asyncio.open_unix_connection(path)
+    for reader in (sender_reader, stuck_reader):
+        await reader.readexactly(HEADER.size)
+
+    # `stuck` never reads, the frames pile up until the broker gives up on it
+    frame = encode_frame(None, "x" * 64 * 1024)
+    for _ in range(200):
+        if len(broker.writers) == 1:
+            break
+        sender.write(frame)
+        await sender.drain()
+    assert len(broker.writers) == 1
+
+    sender.close()
+    stuck.close()
+    await broker.stop()
+
+
+def test_app_starts_and_stops_the_backplanes(
+    tmp_path, monkeypatch, event_loop_for_client
+):
+    from fastapi.testclient import TestClient
+
+    import web_sockets
+    from web_sockets import app, items_manager, manager
+
+    # not configured (no `WEBSOCKET_BACKPLANE_DIR`), no backplanes
+    assert manager.backplane is None
+    assert items_manager.backplane is None
+    monkeypatch.setattr(web_sockets, "BACKPLANE_DIR", str(tmp_path))
+    monkeypatch.setattr(manager, "backplane", web_sockets.make_backplane("chat"))
+    monkeypatch.setattr(
+        items_manager, "backplane", web_sockets.make_backplane("items")
+    )
+    assert manager.backplane.path == str(tmp_path / "chat.sock")
+    # the `with` runs the startup and shutdown events
+    with TestClient(app):
+        assert manager.backplane.broker is not None
+        assert items_manager.backplane.broker is not None
+    assert manager.backplane.broker is None
+    assert items_manager.backplane.broker is None
@@ -0,0 +1,155 @@
+import asyncio
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+from test_websocket_manager import FakeWebSocket
+from web_sockets import app
+from websocket_batching import BatchingWebSocket, FlushPolicy
+from websocket_manager import ConnectionManager
+from websocket_msgpack import pack, unpack
+
+
+class OrderWebSocket:
+    """Records everything sent, in order."""
+
+    def __init__(self, binary: bool = False):
+        self.binary = binary
+        self.sent = []
+
+    async def send_text(self, data: str):
+        self.sent.append(("text", data))
+
+    async def send_bytes(self, data: bytes):
+        self.sent.append(("bytes", data))
+
+    async def send_json(self, data, mode: str = "text"):
+        self.sent.append(("json", data))
+
+    async def close(self, code: int = 1000):
+        self.sent.append(("close", code))
+
+
+@pytest.mark.asyncio
+async def test_messages_within_the_window_are_one_frame():
+    fake = FakeWebSocket()
+    websocket = BatchingWebSocket(fake, FlushPolicy(max_delay=0.01))
+    await websocket.send_text("a")
+    await websocket.send_text("b")
+    await websocket.send_text("c")
+    assert fake.messages == []
+    await asyncio.sleep(0.05)
+    assert fake.messages == ['["a","b","c"]']
+    metrics = websocket.metrics()
+    assert metrics["messages"] == 3
+    assert metrics["frames"] == 1
+    assert metrics["messages_per_frame"] == 3
+    assert 0.01 <= metrics["max_wait"] < 0.05
+
+
+@pytest.mark.asyncio
+async def test_flush_policy_limits():
+    fake = FakeWebSocket()
+    websocket = BatchingWebSocket(
+        fake, FlushPolicy(max_delay=10, max_bytes=6, max_messages=3)
+    )
+    # 6 bytes in UTF-8, only 4 characters
+    await websocket.send_text("ab")
+    await websocket.send_text("éé")
+    # 3 messages
+    for message in "xyz":
+        await websocket.send_text(message)
+    assert [json.loads(frame) for frame in fake.messages] == [
+        ["ab", "éé"],
+        ["x", "y", "z"],
+    ]
+    await websocket.send_text("rest")
+    websocket.stop()
+    assert websocket.metrics()["pending"] == 0
+
+
+@pytest.mark.asyncio
+async def test_broadcasts_are_batched_in_order():
+    manager = ConnectionManager()
+    fake = FakeWebSocket()
+    websocket = BatchingWebSocket(fake, FlushPolicy(max_delay=0.01))
+    await manager.connect(websocket)
+    await websocket.send_text("personal")
+    await manager.broadcast("for everybody")
+    await asyncio.sleep(0.05)
+    assert fake.messages == ['["personal","for everybody"]']
+
+
+@pytest.mark.asyncio
+async def test_messages_with_new_lines():
+    fake = FakeWebSocket()
+    websocket = BatchingWebSocket(fake)
+    await websocket.send_text("two\nlines")
+    await websocket.send_text('"quoted"')
+    await websocket.flush()
+    assert json.loads(fake.messages[0]) == ["two\nlines", '"quoted"']
+    assert websocket.metrics()["bytes"] == len(fake.messages[0].encode())
+
+
+def test_item_endpoint_batch():
+    client = TestClient(app)
+    url = "/items/bar/ws?token=some-token&q=3&batch=true"
+    with client.websocket_connect(url) as websocket:
+        websocket.send_text("hi")
+        assert json.loads(websocket.receive_text()) == [
+            "Session cookie or query token value is : some-token",
+            "Query parameter q is : 3",
+            "Message text was: hi, for item ID: bar",
+        ]
+        # the metrics are updated right after the frame is sent
+        for _ in range(100):
+            (metrics,) = client.get("/items/bar/ws/metrics").json()
+            if metrics["frames"]:
+                break
+        assert metrics["messages"] == 3
+        assert metrics["frames"] == 1
+
+
+@pytest.mark.asyncio
+async def test_other_sends_keep_the_order():
+    raw = OrderWebSocket()
+    websocket = BatchingWebSocket(raw, FlushPolicy(max_delay=10))
+    await websocket.send_text("first")
+    await websocket.send_bytes(b"second")
+    await websocket.send_text("third")
+    await websocket.send_json({"fourth": 4})
+    await websocket.send_text("last")
+    await websocket.close()
+    assert raw.sent == [
+        ("text", '["first"]'),
+        ("bytes", b"second"),
+        ("text", '["third"]'),
+        ("json", {"fourth": 4}),
+        ("text", '["last"]'),
+        ("close", 1000),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_msgpack_batches_are_packed_lists():
+    raw = OrderWebSocket(binary=True)
+    websocket = BatchingWebSocket(raw, FlushPolicy(max_delay=10))
+    await websocket.send_text("a")
+    await websocket.send_text("b")
+    await websocket.flush()
+    ((kind, frame),) = raw.sent
+    assert kind == "bytes"
+    assert unpack(frame) == ["a", "b"]
+    assert websocket.metrics()["bytes"] == len(frame)
+
+
+def test_item_endpoint_batch_msgpack():
+    client = TestClient(app)
+    url = "/items/baz/ws?token=some-token&batch=true"
+    with client.websocket_connect(url, subprotocols=["msgpack"]) as websocket:
+        websocket.send_bytes(pack("hi"))
+        assert unpack(websocket.receive_bytes()) == [
+            "Session cookie or query token value is : some-token",
+            "Message text was: hi, for item ID: baz",
+        ]
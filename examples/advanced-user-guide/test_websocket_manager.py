@@ -0,0 +1,244 @@
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+from web_sockets import app
+from websocket_manager import (
+    ConnectionManager,
+    OverflowPolicy,
+    PreparedMessage,
+)
+from websocket_msgpack import pack, unpack
+
+
+class FakeWebSocket:
+    def __init__(self, delay: float = 0.0, fail: bool = False):
+        self.delay = delay
+        self.fail = fail
+        self.messages = []
+        self.close_code = None
+
+    async def accept(self):
+        pass
+
+    async def close(self, code: int = 1000):
+        self.close_code = code
+
+    async def send(self, message: dict):
+        if self.fail:
+            raise RuntimeError("Cannot call send once a close message has been sent")
+        await asyncio.sleep(self.delay)
+        self.messages.append(message["text"])
+
+    async def send_text(self, data: str):
+        await self.send({"type": "websocket.send", "text": data})
+
+
+@pytest.mark.asyncio
+async def test_broadcast_removes_failed_and_slow_connections():
+    manager = ConnectionManager(max_concurrent_sends=2, send_timeout=0.05)
+    fast = [FakeWebSocket() for _ in range(5)]
+    slow = FakeWebSocket(delay=1)
+    closed = FakeWebSocket(fail=True)
+    for websocket in [slow, *fast[:2], closed, *fast[2:]]:
+        await manager.connect(websocket)
+
+    failed = await manager.broadcast("hello")
+
+    assert set(failed) == {slow, closed}
+    assert (slow.close_code, closed.close_code) == (1011, 1011)
+    assert all(websocket.messages == ["hello"] for websocket in fast)
+    assert all(websocket.close_code is None for websocket in fast)
+    assert list(manager.active_connections.values()) == fast
+    # the endpoint can still call `disconnect()` for a removed connection
+    manager.disconnect(slow)
+
+
+@pytest.mark.asyncio
+async def test_broadcast_runs_sends_concurrently():
+    manager = ConnectionManager(max_concurrent_sends=50, send_timeout=1)
+    for _ in range(100):
+        await manager.connect(FakeWebSocket(delay=0.02))
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    assert await manager.broadcast("hello") == []
+    # two rounds of 50 sends, not 100 sends one after the other
+    assert loop.time() - start < 0.5
+
+
+@pytest.mark.asyncio
+async def test_rooms():
+    manager = ConnectionManager()
+    foo, bar, both = FakeWebSocket(), FakeWebSocket(), FakeWebSocket()
+    for websocket in [foo, bar, both]:
+        await manager.connect(websocket)
+    manager.join(foo, "foo")
+    manager.join(bar, "bar")
+    manager.join(both, "foo")
+    manager.join(both, "bar")
+
+    await manager.publish("foo", "to foo")
+    await manager.publish("nobody", "to nobody")
+    assert foo.messages == ["to foo"]
+    assert bar.messages == []
+    assert both.messages == ["to foo"]
+
+    manager.leave(both, "foo")
+    assert manager.room_connections("foo") == [foo]
+    manager.disconnect(both)
+    assert manager.room_connections("bar") == [bar]
+    manager.disconnect(foo)
+    # empty rooms are removed
+    assert list(manager.rooms) == ["bar"]
+    assert manager.connection_rooms == {id(bar): {"bar"}}
+
+
+class RecordingWebSocket(FakeWebSocket):
+    """Keeps the ASGI messages themselves, not only their text."""
+
+    async def send(self, message: dict):
+        self.messages.append(message)
+
+
+class PreparingWebSocket(FakeWebSocket):
+    async def send_prepared(self, prepared: PreparedMessage):
+        self.messages.append(prepared.encoded("msgpack", pack))
+
+
+@pytest.mark.asyncio
+async def test_broadcast_prepares_the_message_once():
+    manager = ConnectionManager()
+    asgi = [RecordingWebSocket() for _ in range(3)]
+    preparing = [PreparingWebSocket() for _ in range(3)]
+    for websocket in [*asgi, *preparing]:
+        await manager.connect(websocket)
+
+    await manager.broadcast("héllo")
+
+    message = asgi[0].messages[0]
+    assert message == {"type": "websocket.send", "text": "héllo"}
+    # the very same ASGI message, and the same MessagePack bytes, for every
+    # connection
+    assert all(websocket.messages[0] is message for websocket in asgi)
+    packed = preparing[0].messages[0]
+    assert unpack(packed) == "héllo"
+    assert all(websocket.messages[0] is packed for websocket in preparing)
+
+
+@pytest.mark.asyncio
+async def test_queued_personal_message():
+    manager = ConnectionManager(queue_size=3)
+    websocket = FakeWebSocket()
+    await manager.connect(websocket)
+
+    await manager.send_personal_message("only for you", websocket)
+    assert manager.queues[id(websocket)].messages[0] == "only for you"
+    await asyncio.sleep(0.01)
+    assert websocket.messages == ["only for you"]
+    await disconnect_all(manager)
+
+
+async def disconnect_all(manager: ConnectionManager):
+    for websocket in list(manager.active_connections.values()):
+        manager.disconnect(websocket)
+    # let the writers be cancelled
+    await asyncio.sleep(0)
+
+
+async def queued_manager(overflow: OverflowPolicy):
+    manager = ConnectionManager(queue_size=3, overflow=overflow, send_timeout=1)
+    slow = FakeWebSocket(delay=0.2)
+    fast = FakeWebSocket()
+    await manager.connect(slow)
+    await manager.connect(fast)
+    for i in range(6):
+        await manager.broadcast(str(i))
+        # the fast client gets each message right away, the slow one is still
+        # sending "0"
+        await asyncio.sleep(0.01)
+    return manager, slow, fast
+
+
+@pytest.mark.asyncio
+async def test_queue_drop_oldest():
+    manager, slow, fast = await queued_manager(OverflowPolicy.DROP_OLDEST)
+    # "0" is being sent, "1" and "2" were dropped
+    assert manager.metrics()["max_queue_depth"] == 3
+    assert manager.metrics()["dropped"] == 2
+    await asyncio.sleep(0.9)
+    assert slow.messages == ["0", "3", "4", "5"]
+    assert fast.messages == ["0", "1", "2", "3", "4", "5"]
+    assert manager.metrics()["queued_messages"] == 0
+    await disconnect_all(manager)
+
+
+@pytest.mark.asyncio
+async def test_queue_coalesce():
+    manager, slow, fast = await queued_manager(OverflowPolicy.COALESCE)
+    assert manager.metrics()["queued_messages"] == 2
+    await asyncio.sleep(0.6)
+    assert slow.messages == ["0", "4", "5"]
+    assert len(fast.messages) == 6
+    await disconnect_all(manager)
+
+
+@pytest.mark.asyncio
+async def test_queue_close_evicts_slow_consumer():
+    manager, slow, fast = await queued_manager(OverflowPolicy.CLOSE)
+    await asyncio.sleep(0.3)
+    assert slow.close_code == 1013
+    assert list(manager.active_connections.values()) == [fast]
+    metrics = manager.metrics()
+    assert metrics["evicted"] == 1
+    assert metrics["connections"] == 1
+    await disconnect_all(manager)
+
+
+@pytest.mark.asyncio
+async def test_queue_send_timeout_evicts_and_closes():
+    manager = ConnectionManager(queue_size=10, send_timeout=0.05)
+    slow = FakeWebSocket(delay=1)
+    await manager.connect(slow)
+    await manager.broadcast("too slow")
+    await asyncio.sleep(0.15)
+
+    assert slow.close_code == 1011
+    assert manager.active_connections == {}
+    assert manager.metrics()["evicted"] == 1
+    # not sent directly, bypassing the queue, nor anywhere else
+    await manager.send_personal_message("still there?", slow)
+    assert slow.messages == []
+
+
+def test_chat_broadcast():
+    # each `websocket_connect()` of the `TestClient` runs in its own event loop,
+    # so this uses a single client, the other tests use fake connections
+    client = TestClient(app)
+    with client.websocket_connect("/ws/1") as websocket:
+        websocket.send_text("hi")
+        assert websocket.receive_text() == "You wrote: hi"
+        assert websocket.receive_text() == "Client #1 says: hi"
+        metrics = client.get("/ws/metrics").json()
+        assert metrics["connections"] == 1
+        assert metrics["queue_size"] == 100
+        assert metrics["evicted"] == 0
+
+
+def test_item_room():
+    client = TestClient(app)
+    with client.websocket_connect("/items/foo/ws?token=some-token&q=3") as websocket:
+        websocket.send_text("hi")
+        assert websocket.receive_text() == (
+            "Session cookie or query token value is : some-token"
+        )
+        assert websocket.receive_text() == "Query parameter q is : 3"
+        assert websocket.receive_text() == "Message text was: hi, for item ID: foo"
+
+
+def test_chat_msgpack():
+    client = TestClient(app)
+    with client.websocket_connect("/ws/3", subprotocols=["msgpack"]) as websocket:
+        websocket.send_bytes(pack("hi"))
+        assert unpack(websocket.receive_bytes()) == "You wrote: hi"
+        assert unpack(websocket.receive_bytes()) == "Client #3 says: hi"
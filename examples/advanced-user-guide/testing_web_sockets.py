@@ -2,9 +2,10 @@
 We can use the same `TestClient` to test WebSockets.
 For this, we use the `TestClient` in a `with` statement, connecting to the WebSocket
 """
-from fastapi import FastAPI
+from fastapi import Depends, FastAPI
 from fastapi.testclient import TestClient
-from fastapi.websockets import WebSocket
+
+from websocket_msgpack import CodecWebSocket, negotiated_websocket, unpack
 
 app = FastAPI()
 
@@ -14,8 +15,8 @@ async def read_main():
     return {"msg": "Hello World"}
 
 
-@app.websocket_route("/ws")
-async def websocket(websocket: WebSocket):
+@app.websocket("/ws")
+async def websocket(websocket: CodecWebSocket = Depends(negotiated_websocket)):
     await websocket.accept()
     await websocket.send_json({"msg": "Hello WebSocket"})
     await websocket.close()
@@ -30,6 +31,15 @@ def test_read_main():
 
 def test_websocket():
     client = TestClient(app)
-    with client.websocket.connect("/ws") as websocket:
+    with client.websocket_connect("/ws") as websocket:
         data = websocket.receive_json()
         assert data == {"msg": "Hello WebSocket"}
+
+
+def test_websocket_msgpack():
+    """A client that asks for the `msgpack` subprotocol gets the same data, as MessagePack."""
+    client = TestClient(app)
+    with client.websocket_connect("/ws", subprotocols=["msgpack"]) as websocket:
+        assert websocket.accepted_subprotocol == "msgpack"
+        data = unpack(websocket.receive_bytes())
+        assert data == {"msg": "Hello WebSocket"}
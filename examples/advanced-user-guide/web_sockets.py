@@ -10,9 +10,11 @@ In production, we could have one of the options above.
 But it's the simplest way to focus on the server-side of WebSockets and have a working example
 """
 # creating a `websocket`
-from fastapi import FastAPI, WebSocket
+from fastapi import Depends, FastAPI, WebSocket
 from fastapi.responses import HTMLResponse
 
+from websocket_msgpack import CodecWebSocket, negotiated_websocket
+
 app = FastAPI()
 
 html = """
@@ -56,9 +58,13 @@ async def get():
 
 
 @app.websocket("/ws")
-async def websocket_endpoint(websocket: WebSocket):
+async def websocket_endpoint(websocket: CodecWebSocket = Depends(negotiated_websocket)):
     """We can `await` for messages and send messages.
     We can receive and send binary, text, and JSON data
+
+    With `Depends(negotiated_websocket)`, a client that asks for the `msgpack` subprotocol
+    (in the `Sec-WebSocket-Protocol` header) gets binary MessagePack frames instead of text,
+    with the same code (see `websocket_msgpack.py`).
     """
     await websocket.accept()
     while True:
@@ -138,28 +144,65 @@ async def get_cookie_or_token(
     return session or token
 
 
+"""
+Each `item_id` is a "room": the message is sent to every client connected to the same item, and only to them.
+`items_manager` keeps the connections of each room (see `websocket_manager.py`), so publishing to an item
+doesn't have to go through the connections of all the other items.
+"""
+from fastapi import WebSocketDisconnect
+
+from websocket_batching import BatchingWebSocket, FlushPolicy
+from websocket_manager import ConnectionManager
+
+items_manager = ConnectionManager()
+
+"""
+A client that connects with `?batch=true` gets the messages sent within 5 ms (or until there are 64 KB of them)
+together in a single frame, a JSON array of the messages (see `websocket_batching.py`).
+"""
+items_flush_policy = FlushPolicy(max_delay=0.005, max_bytes=64 * 1024)
+
+
+@app.get("/items/{item_id}/ws/metrics")
+async def read_item_batching_metrics(item_id: str):
+    return [
+        websocket.metrics()
+        for websocket in items_manager.room_connections(item_id)
+        if isinstance(websocket, BatchingWebSocket)
+    ]
+
+
 @app.websocket("/items/{item_id}/ws")
 async def websocket_endpoint(
-    websocket: WebSocket,
     item_id: str,
+    websocket: CodecWebSocket = Depends(negotiated_websocket),
     q: Optional[int] = None,
+    batch: bool = False,
     cookie_or_token: str = Depends(get_cookie_or_token),
 ):
-    await websocket.accept()
-    while True:
-        data = await websocket.receive_text()
-        await websocket.send_text(
-            f"Session cookie or query token value is : {cookie_or_token}"
-        )
-        if q is not None:
-            await websocket.send_text(f"Query parameter q is : {q}")
-        await websocket.send_text(f"Message text was: {data}, for item ID: {item_id}")
+    if batch:
+        websocket = BatchingWebSocket(websocket, items_flush_policy)
+    await items_manager.connect(websocket)
+    items_manager.join(websocket, item_id)
+    try:
+        while True:
+            data = await websocket.receive_text()
+            await websocket.send_text(
+                f"Session cookie or query token value is : {cookie_or_token}"
+            )
+            if q is not None:
+                await websocket.send_text(f"Query parameter q is : {q}")
+            await items_manager.publish(
+                item_id, f"Message text was: {data}, for item ID: {item_id}"
+            )
+    except WebSocketDisconnect:
+        items_manager.disconnect(websocket)
+        if batch:
+            websocket.stop()
 
 """HANDLING DISCONNECTIONS AND MULTIPLE CLIENTS
 When a WebSocket connection is closed, the `await websocket.receive_text()` will raise a `WebSocketDisconnect` exception, which we can then catch and handle like as follows
 """
-from typing import List
-
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect
 from fastapi.responses import HTMLResponse
 
@@ -202,25 +245,57 @@ html2 = """
 """
 
 
-class ConnectionManager:
-    def __init__(self):
-        self.active_connections: List[WebSocket] = []
+"""
+The `ConnectionManager` keeps the active connections and sends messages to them.
+`broadcast()` sends to many connections at the same time, with a timeout for each one,
+so a slow or closed connection doesn't hold back the rest (see `websocket_manager.py`).
+
+With `queue_size`, each connection has its own queue of at most 100 messages to send, and a client
+that falls further behind is disconnected with code `1013`, so it can't make the server's memory grow.
+
+With a `backplane`, the messages also reach the clients connected to the other workers (e.g. with
+`uvicorn --workers 4`), through a Unix domain socket that one of the workers listens on
+(see `websocket_backplane.py`). The managers connect to it when the app starts.
+
+The backplane is only used when the `WEBSOCKET_BACKPLANE_DIR` environment variable is set, to a
+directory only the app can write to (not a shared one like `/tmp`), the sockets are created there:
+
+    WEBSOCKET_BACKPLANE_DIR=/run/fastapi-chat uvicorn web_sockets:app --workers 4
+"""
+import os
+
+from websocket_backplane import UnixSocketBackplane
+from websocket_manager import ConnectionManager, OverflowPolicy
+
+BACKPLANE_DIR = os.environ.get("WEBSOCKET_BACKPLANE_DIR")
+
+
+def make_backplane(name: str) -> Optional[UnixSocketBackplane]:
+    if not BACKPLANE_DIR:
+        return None
+    return UnixSocketBackplane(os.path.join(BACKPLANE_DIR, name + ".sock"))
+
 
-    async def connect(self, websocket: WebSocket):
-        await websocket.accept()
-        self.active_connections.append(websocket)
+manager = ConnectionManager(
+    max_concurrent_sends=100,
+    send_timeout=5.0,
+    queue_size=100,
+    overflow=OverflowPolicy.CLOSE,
+    backplane=make_backplane("chat"),
+)
+items_manager.backplane = make_backplane("items")
 
-    def disconnect(self, websocket: WebSocket):
-        self.active_connections.remove(websocket)
 
-    async def send_personal_message(self, message: str, websocket: WebSocket):
-        await websocket.send_text(message)
+@app.on_event("startup")
+async def start_connection_managers():
+    await manager.start()
+    await items_manager.start()
 
-    async def broadcast(self, message: str):
-        for connection in self.active_connections:
-            await connection.send_text(message)
 
-manager = ConnectionManager()
+@app.on_event("shutdown")
+async def stop_connection_managers():
+    await manager.stop()
+    await items_manager.stop()
 
 
 @app.get("/b")
@@ -228,8 +303,16 @@ async def get():
     return HTMLResponse(html2)
 
 
+@app.get("/ws/metrics")
+async def read_chat_metrics():
+    """How many messages are waiting in the queues, sent, dropped, and how many clients were evicted."""
+    return manager.metrics()
+
+
 @app.websocket("/ws/{client_id}")
-async def websocket_endpoint(websocket: WebSocket, client_id: int):
+async def websocket_endpoint(
+    client_id: int, websocket: CodecWebSocket = Depends(negotiated_websocket)
+):
     await manager.connect(websocket)
     try:
         while True:
@@ -243,5 +326,6 @@ async def websocket_endpoint(websocket: WebSocket, client_id: int):
 """
 The app above is a minimal and simple example to demonstrate how to handle and broadcast messages to several WebSocket connections.
 
-As everything is handled in memory, in a single list, it will only work while the process is running, and will only work with a single process.
+As everything is handled in memory, it will only work while the process is running. With the `UnixSocketBackplane`,
+it works with several processes on the same machine, for several machines, a backplane could use something like Redis Pub/Sub.
 """
\ No newline at end of file
@@ -0,0 +1,211 @@
+"""
+Sending the messages of a `ConnectionManager` to the other worker processes.
+
+A `ConnectionManager` only knows the connections of its own process. When the
+app runs with several workers (e.g. `uvicorn --workers 4`), each client is
+connected to one of them, and a `broadcast()` in one worker never reaches the
+clients of the others.
+
+A "backplane" connects the managers of all the workers: when a manager
+broadcasts or publishes a message, it sends it to its own connections, and it
+also gives the message (once) to the backplane, that gives it (once) to each of
+the other workers, and each of them sends it to its own connections.
+
+`UnixSocketBackplane` needs nothing else installed or running: the first
+worker that starts also runs a small "broker" on a Unix domain socket, and all
+the workers (that one included) connect to it. The worker that runs the broker
+is chosen with a lock on a file, so only one of them does, and if that worker
+stops, another one takes over. It only works for the workers on the same
+machine, for several machines, something with the same `start`, `publish` and
+`stop` methods could use e.g. Redis Pub/Sub.
+
+Each message goes through the socket as its length (4 bytes) followed by a
+small JSON object with the room (`null` for a broadcast) and the message.
+
+The broker waits until each worker took the frames written to it (`drain()`),
+at most `drain_timeout` seconds. A worker that doesn't read them in time (e.g.
+it's stuck) is disconnected, instead of making the broker keep more and more
+frames in memory for it, it connects again when it can.
+"""
+import asyncio
+import fcntl
+import json
+import os
+import struct
+from typing import Awaitable, Callable, Optional, Set
+
+MessageHandler = Callable[[Optional[str], str], Awaitable]
+
+HEADER = struct.Struct("!I")
+
+
+def encode_frame(room: Optional[str], message: str) -> bytes:
+    body = json.dumps({"room": room, "message": message}).encode()
+    return HEADER.pack(len(body)) + body
+
+
+async def read_frame(reader: asyncio.StreamReader) -> bytes:
+    """Read one whole frame (header included), raises `IncompleteReadError` when
+    the other side closed the connection.
+    """
+    header = await reader.readexactly(HEADER.size)
+    (length,) = HEADER.unpack(header)
+    return header + await reader.readexactly(length)
+
+
+def decode_frame(frame: bytes):
+    data = json.loads(frame[HEADER.size :])
+    return data["room"], data["message"]
+
+
+class UnixSocketBroker:
+    """Receives frames from each worker and writes them to all the others."""
+
+    def __init__(self, path: str, drain_timeout: float = 5.0):
+        self.path = path
+        self.drain_timeout = drain_timeout
+        self.writers: Set[asyncio.StreamWriter] = set()
+        self.serving = False
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self):
+        # a socket file left by a broker that didn't stop cleanly
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self.serving = True
+        self._server = await asyncio.start_unix_server(self._handle, path=self.path)
+
+    async def stop(self):
+        self.serving = False
+        if self._server is not None:
+            self._server.close()
+            for writer in list(self.writers):
+                writer.close()
+            self._server = None
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        if not self.serving:
+            # accepted right before `stop()`, let that worker connect again
+            writer.close()
+            return
+        self.writers.add(writer)
+        # an empty frame, to tell the worker it's connected (see `_connect()`)
+        writer.write(HEADER.pack(0))
+        try:
+            while True:
+                frame = await read_frame(reader)
+                await self._forward(frame, writer)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self.writers.discard(writer)
+            writer.close()
+
+    async def _forward(self, frame: bytes, sender: asyncio.StreamWriter):
+        others = [other for other in self.writers if other is not sender]
+        for other in others:
+            other.write(frame)
+        # all at the same time, a slow worker doesn't delay the others
+        results = await asyncio.gather(
+            *(asyncio.wait_for(other.drain(), self.drain_timeout) for other in others),
+            return_exceptions=True,
+        )
+        for other, result in zip(others, results):
+            if isinstance(result, Exception):
+                self.writers.discard(other)
+                other.close()
+
+
+class UnixSocketBackplane:
+    def __init__(
+        self, path: str, reconnect_delay: float = 0.5, drain_timeout: float = 5.0
+    ):
+        self.path = path
+        self.reconnect_delay = reconnect_delay
+        self.drain_timeout = drain_timeout
+        self.published = 0
+        self.received = 0
+        self.broker: Optional[UnixSocketBroker] = None
+        self._lock_file = None
+        self._handler: Optional[MessageHandler] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self, handler: MessageHandler):
+        """Connect to the broker (starting it first if no worker runs it yet), and
+        call `handler(room, message)` for each message of the other workers.
+        """
+        self._handler = handler
+        reader = await self._connect()
+        self._task = asyncio.ensure_future(self._read(reader))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        if self.broker is not None:
+            await self.broker.stop()
+            self.broker = None
+        if self._lock_file is not None:
+            # closing the file releases the lock, another worker can run the broker
+            self._lock_file.close()
+            self._lock_file = None
+
+    async def publish(self, room: Optional[str], message: str):
+        # before `start()` (or while reconnecting), there's no one to send it to
+        if self._writer is None:
+            return
+        self._writer.write(encode_frame(room, message))
+        self.published += 1
+        await self._writer.drain()
+
+    def _try_lock(self) -> bool:
+        """Only one worker at a time can hold the lock, that one runs the broker.
+        The operating system releases it when the process ends, even if it crashed.
+        """
+        lock_file = open(self.path + ".lock", "w")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        return True
+
+    async def _connect(self) -> asyncio.StreamReader:
+        while True:
+            if self.broker is None and self._try_lock():
+                self.broker = UnixSocketBroker(self.path, self.drain_timeout)
+                await self.broker.start()
+            writer = None
+            try:
+                reader, writer = await asyncio.open_unix_connection(self.path)
+                # wait until the broker really took the connection, if it was
+                # stopping, it closes it instead
+                await reader.readexactly(HEADER.size)
+            except (FileNotFoundError, ConnectionError, asyncio.IncompleteReadError):
+                # the worker with the lock hasn't started the broker yet
+                if writer is not None:
+                    writer.close()
+                await asyncio.sleep(self.reconnect_delay)
+                continue
+            self._writer = writer
+            return reader
+
+    async def _read(self, reader: asyncio.StreamReader):
+        while True:
+            try:
+                frame = await read_frame(reader)
+            except (asyncio.IncompleteReadError, ConnectionError):
+                # the worker running the broker stopped, connect again (and
+                # maybe run the broker in this worker)
+                self._writer = None
+                await asyncio.sleep(self.reconnect_delay)
+                reader = await self._connect()
+                continue
+            self.received += 1
+            room, message = decode_frame(frame)
+            await self._handler(room, message)
@@ -0,0 +1,175 @@
+"""
+Sending many small messages as fewer, bigger frames.
+
+For each message it receives, the `/items/{item_id}/ws` endpoint in
+`web_sockets.py` sends up to three messages, each one in its own frame, each
+one a separate write to the network. When messages come at a high rate, the
+cost of each write (and of each frame for the client) is more than the cost of
+the data in it.
+
+`BatchingWebSocket` wraps a `WebSocket` (or a `CodecWebSocket`). The messages
+sent through it are kept for a short time, and sent together in a single text
+frame. The `FlushPolicy` decides when to send them: when the first message
+waited `max_delay` seconds, or as soon as there are `max_bytes` bytes (of the
+UTF-8 encoded messages) or `max_messages` messages waiting.
+
+Each frame is a JSON array with the messages, in the order they were sent, e.g.
+`["first message", "second message"]`. The messages can have any text inside,
+new lines included. The client has to parse it, in JavaScript:
+
+    ws.onmessage = function(event) {
+        JSON.parse(event.data).forEach(function(message) { ... })
+    };
+
+That's why it's only used when the client asks for it (e.g. with
+`?batch=true`). If the wrapped connection is a `CodecWebSocket` that
+negotiated MessagePack, each frame is the same list, packed with MessagePack in
+a binary frame.
+
+Anything else sent through it (`send_bytes()`, `send_json()`, `close()`, etc.)
+first sends the messages waiting, so everything arrives in the order it was
+sent, and nothing is left behind when the connection is closed.
+
+`metrics()` tells how many messages and frames were sent, and how long the
+messages waited before being sent.
+"""
+import asyncio
+import json
+import time
+from typing import List, Optional
+
+from fastapi import WebSocket
+
+from websocket_msgpack import pack
+
+
+class FlushPolicy:
+    def __init__(
+        self,
+        max_delay: float = 0.005,
+        max_bytes: int = 64 * 1024,
+        max_messages: Optional[int] = None,
+    ):
+        self.max_delay = max_delay
+        self.max_bytes = max_bytes
+        self.max_messages = max_messages
+
+
+class BatchingWebSocket:
+    def __init__(self, websocket: WebSocket, policy: Optional[FlushPolicy] = None):
+        self.websocket = websocket
+        self.policy = policy if policy is not None else FlushPolicy()
+        self.messages = 0
+        self.frames = 0
+        self.bytes = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.started: Optional[float] = None
+        self._pending: List[str] = []
+        self._pending_since: List[float] = []
+        self._pending_bytes = 0
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._lock = asyncio.Lock()
+
+    def __getattr__(self, name):
+        # `accept()`, `receive_text()`, `close()`, etc. of the wrapped connection
+        return getattr(self.websocket, name)
+
+    async def send_text(self, data: str):
+        now = time.perf_counter()
+        if self.started is None:
+            self.started = now
+        self._pending.append(data)
+        self._pending_since.append(now)
+        self._pending_bytes += len(data.encode())
+        policy = self.policy
+        if self._pending_bytes >= policy.max_bytes or (
+            policy.max_messages is not None
+            and len(self._pending) >= policy.max_messages
+        ):
+            await self.flush()
+        elif self._timer is None:
+            loop = asyncio.get_running_loop()
+            self._timer = loop.call_later(
+                policy.max_delay, lambda: asyncio.ensure_future(self._flush_later())
+            )
+
+    async def send(self, message: dict):
+        """Text messages are batched, anything else is sent right away (after the
+        messages waiting, to keep the order).
+        """
+        if message.get("type") == "websocket.send" and "text" in message:
+            await self.send_text(message["text"])
+        else:
+            await self.flush()
+            await self.websocket.send(message)
+
+    async def send_bytes(self, data: bytes):
+        await self.flush()
+        await self.websocket.send_bytes(data)
+
+    async def send_json(self, data, mode: str = "text"):
+        await self.flush()
+        await self.websocket.send_json(data, mode=mode)
+
+    async def close(self, code: int = 1000):
+        try:
+            await self.flush()
+        finally:
+            await self.websocket.close(code=code)
+
+    async def send_prepared(self, prepared):
+        # a broadcast of the `ConnectionManager`
+        await self.send_text(prepared.text)
+
+    async def flush(self):
+        async with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if not self._pending:
+                return
+            messages, since = self._pending, self._pending_since
+            self._pending, self._pending_since, self._pending_bytes = [], [], 0
+            if getattr(self.websocket, "binary", False):
+                # a `CodecWebSocket` using MessagePack
+                frame = pack(messages)
+                await self.websocket.send_bytes(frame)
+            else:
+                text = json.dumps(messages, ensure_ascii=False, separators=(",", ":"))
+                frame = text.encode()
+                await self.websocket.send_text(text)
+            now = time.perf_counter()
+            self.messages += len(messages)
+            self.frames += 1
+            self.bytes += len(frame)
+            self.total_wait += sum(now - enqueued for enqueued in since)
+            self.max_wait = max(self.max_wait, now - since[0])
+
+    async def _flush_later(self):
+        try:
+            await self.flush()
+        except Exception:
+            # nobody is `await`ing this, if the client is gone, forget the rest,
+            # the endpoint will get the disconnect
+            self.stop()
+
+    def stop(self):
+        """Forget the messages waiting, e.g. when the client disconnected."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self._pending, self._pending_since, self._pending_bytes = [], [], 0
+
+    def metrics(self):
+        elapsed = time.perf_counter() - self.started if self.started else 0.0
+        return {
+            "messages": self.messages,
+            "frames": self.frames,
+            "bytes": self.bytes,
+            "pending": len(self._pending),
+            "messages_per_frame": self.messages / self.frames if self.frames else 0.0,
+            "average_wait": self.total_wait / self.messages if self.messages else 0.0,
+            "max_wait": self.max_wait,
+            "messages_per_second": self.messages / elapsed if elapsed else 0.0,
+        }
@@ -0,0 +1,373 @@
+"""
+The `ConnectionManager` of the chat in `web_sockets.py`.
+
+The first version sent a broadcast to each connection one after the other,
+`await`ing each `send_text()`. With many clients, the last one has to wait for
+all the others, and a single slow client (e.g. on a bad network, with its
+buffers full) makes everybody behind it wait too. And if a connection was
+already closed, `send_text()` raises in the middle of the loop, and the rest of
+the clients don't get the message at all.
+
+Now `broadcast()` sends to up to `max_concurrent_sends` connections at the same
+time, and gives each send at most `send_timeout` seconds. A connection that
+fails or is too slow is removed from `active_connections` instead of stopping
+the broadcast, it won't receive more messages, and it's closed with code `1011`
+("Internal Error"), if it's still open, so the client knows it can reconnect.
+
+With `queue_size`, each connection gets its own `OutboundQueue` instead: sending
+a message just adds it to the queue, and a "writer" task per connection sends
+the queued messages to its client. A slow client only makes its own queue grow,
+and only up to `queue_size` messages, then the `overflow` policy decides what
+to do (see `OverflowPolicy`), so a client that doesn't read can't make the
+server use more and more memory. A client that takes more than `send_timeout`
+seconds to take a message (or fails) is evicted and closed with code `1011`.
+
+Connections can also join "rooms" (e.g. one per `item_id`), and `publish()`
+sends a message only to the connections in a room. The connections and the
+rooms are `dict`s, so connecting, disconnecting, joining, leaving and finding
+the connections of a room don't depend on how many connections there are.
+
+With a `backplane` (see `websocket_backplane.py`), `broadcast()` and `publish()`
+also reach the connections of the other worker processes. Call `start()` and
+`stop()` when the app starts and stops, to connect to the backplane.
+
+A message sent to many connections is prepared only once (see
+`PreparedMessage`), not once for each connection.
+"""
+import asyncio
+from collections import deque
+from enum import Enum
+from typing import Callable, Deque, Dict, Iterable, List, Optional, Set, Union
+
+from fastapi import WebSocket, status
+
+
+class PreparedMessage:
+    """A text message, ready to be sent to any number of connections.
+
+    `send_text(message)` makes a new ASGI message for each connection. A
+    `PreparedMessage` is made once for a broadcast, and then:
+
+    - A normal (Starlette) `WebSocket` receives the same ASGI message every time,
+    with `websocket.send()`. That only saves making a small `dict` for each
+    connection: ASGI doesn't let the app write bytes to the network, so the
+    server still encodes the text and builds a frame with it for each
+    connection, and there's no way to share those frames from here.
+    - A connection with a `send_prepared()` method decides itself what to send,
+    e.g. a `CodecWebSocket` (see `websocket_msgpack.py`) sends it as MessagePack,
+    made with `encoded()` only once for all the connections, instead of packing
+    the same text again for each one.
+    """
+
+    __slots__ = ("text", "asgi_message", "_encoded")
+
+    def __init__(self, text: str):
+        self.text = text
+        self.asgi_message = {"type": "websocket.send", "text": text}
+        self._encoded: Dict[str, dict] = {}
+
+    def encoded(self, name: str, encode: Callable[[str], dict]) -> dict:
+        """The ASGI message made by `encode(text)`, made the first time only."""
+        message = self._encoded.get(name)
+        if message is None:
+            message = self._encoded[name] = encode(self.text)
+        return message
+
+    async def send(self, websocket: WebSocket):
+        send_prepared = getattr(websocket, "send_prepared", None)
+        if send_prepared is not None:
+            await send_prepared(self)
+        else:
+            await websocket.send(self.asgi_message)
+
+
+class OverflowPolicy(str, Enum):
+    """What to do when a message is sent to a connection with a full queue.
+
+    - `drop_oldest`: drop the oldest queued message to make room for the new one.
+    - `coalesce`: drop all the queued messages, the client only gets the newest
+    one, e.g. when each message is the whole current state (like a price or a
+    list of users online) and the old ones are not needed anymore.
+    - `close`: close the connection with code `1013` ("Try Again Later"), the
+    client can reconnect when it's able to keep up.
+    """
+
+    DROP_OLDEST = "drop_oldest"
+    COALESCE = "coalesce"
+    CLOSE = "close"
+
+
+class OutboundQueue:
+    def __init__(
+        self,
+        websocket: WebSocket,
+        maxsize: int,
+        overflow: OverflowPolicy,
+        send_timeout: float,
+        on_close: Callable[[WebSocket], None],
+    ):
+        self.websocket = websocket
+        self.maxsize = maxsize
+        self.overflow = overflow
+        self.send_timeout = send_timeout
+        self.on_close = on_close
+        # a `str` is a personal message, sent with `send_text()`
+        self.messages: Deque[Union[str, PreparedMessage]] = deque()
+        self.sent = 0
+        self.dropped = 0
+        self.evicted = False
+        self.closing = False
+        self.close_code: Optional[int] = None
+        self._ready = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def depth(self) -> int:
+        return len(self.messages)
+
+    def start(self):
+        self._task = asyncio.ensure_future(self._writer())
+
+    def stop(self):
+        if self._task is not None and self._task is not asyncio.current_task():
+            self._task.cancel()
+
+    def put(self, message: Union[str, PreparedMessage]) -> bool:
+        """Queue the message, return `False` if the connection is being closed."""
+        if self.closing:
+            return False
+        if len(self.messages) >= self.maxsize:
+            if self.overflow == OverflowPolicy.CLOSE:
+                self.evicted = True
+                self.close(code=status.WS_1013_TRY_AGAIN_LATER)
+                return False
+            if self.overflow == OverflowPolicy.COALESCE:
+                self.dropped += len(self.messages)
+                self.messages.clear()
+            else:
+                self.messages.popleft()
+                self.dropped += 1
+        self.messages.append(message)
+        self._ready.set()
+        return True
+
+    def close(self, code: int):
+        """Drop the queued messages and let the writer close the connection."""
+        self.closing = True
+        self.close_code = code
+        self.dropped += len(self.messages)
+        self.messages.clear()
+        self._ready.set()
+
+    async def _writer(self):
+        try:
+            while not self.closing:
+                await self._ready.wait()
+                while self.messages:
+                    message = self.messages.popleft()
+                    if isinstance(message, str):
+                        send = self.websocket.send_text(message)
+                    else:
+                        send = message.send(self.websocket)
+                    await asyncio.wait_for(send, timeout=self.send_timeout)
+                    self.sent += 1
+                self._ready.clear()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # the client is gone or too slow, evict it, as when its queue is full
+            self.evicted = True
+            self.close_code = status.WS_1011_INTERNAL_ERROR
+            self.dropped += len(self.messages)
+            self.messages.clear()
+        try:
+            await asyncio.wait_for(
+                self.websocket.close(code=self.close_code), timeout=self.send_timeout
+            )
+        except Exception:
+            # most likely it was already closed
+            pass
+        self.on_close(self.websocket)
+
+
+class ConnectionManager:
+    def __init__(
+        self,
+        max_concurrent_sends: int = 100,
+        send_timeout: float = 5.0,
+        queue_size: Optional[int] = None,
+        overflow: OverflowPolicy = OverflowPolicy.DROP_OLDEST,
+        backplane=None,
+    ):
+        self.max_concurrent_sends = max_concurrent_sends
+        self.send_timeout = send_timeout
+        self.queue_size = queue_size
+        self.overflow = overflow
+        self.backplane = backplane
+        # `WebSocket`s can't be used as `dict` keys or in a `set` (they compare
+        # like their `scope`), so everything is stored by the `id()` of the
+        # connection
+        self.active_connections: Dict[int, WebSocket] = {}
+        self.queues: Dict[int, OutboundQueue] = {}
+        self.rooms: Dict[str, Dict[int, WebSocket]] = {}
+        # the rooms of each connection, to leave them all when it disconnects
+        self.connection_rooms: Dict[int, Set[str]] = {}
+        # messages sent and dropped, and connections evicted, of the queues
+        # already closed
+        self.sent = 0
+        self.dropped = 0
+        self.evicted = 0
+
+    async def start(self):
+        if self.backplane is not None:
+            await self.backplane.start(self._receive_from_backplane)
+
+    async def stop(self):
+        if self.backplane is not None:
+            await self.backplane.stop()
+
+    async def _receive_from_backplane(self, room: Optional[str], message: str):
+        """A message of another worker, for the connections of this one."""
+        if room is None:
+            await self._send_to(self.active_connections.values(), message)
+        else:
+            await self._send_to(self.rooms.get(room, {}).values(), message)
+
+    async def connect(self, websocket: WebSocket):
+        await websocket.accept()
+        self.active_connections[id(websocket)] = websocket
+        if self.queue_size is not None:
+            queue = OutboundQueue(
+                websocket,
+                maxsize=self.queue_size,
+                overflow=self.overflow,
+                send_timeout=self.send_timeout,
+                on_close=self.disconnect,
+            )
+            self.queues[id(websocket)] = queue
+            queue.start()
+
+    def disconnect(self, websocket: WebSocket):
+        # it might have been removed already by a `broadcast()` that failed
+        self.active_connections.pop(id(websocket), None)
+        for room in self.connection_rooms.pop(id(websocket), ()):
+            self._remove_from_room(websocket, room)
+        queue = self.queues.pop(id(websocket), None)
+        if queue is not None:
+            queue.stop()
+            self.sent += queue.sent
+            self.dropped += queue.dropped + queue.depth
+            self.evicted += queue.evicted
+
+    def join(self, websocket: WebSocket, room: str):
+        self.rooms.setdefault(room, {})[id(websocket)] = websocket
+        self.connection_rooms.setdefault(id(websocket), set()).add(room)
+
+    def leave(self, websocket: WebSocket, room: str):
+        rooms = self.connection_rooms.get(id(websocket))
+        if rooms is not None:
+            rooms.discard(room)
+        self._remove_from_room(websocket, room)
+
+    def _remove_from_room(self, websocket: WebSocket, room: str):
+        connections = self.rooms.get(room)
+        if connections is not None:
+            connections.pop(id(websocket), None)
+            # don't keep empty rooms, e.g. of items nobody is watching anymore
+            if not connections:
+                del self.rooms[room]
+
+    def room_connections(self, room: str) -> List[WebSocket]:
+        return list(self.rooms.get(room, {}).values())
+
+    async def send_personal_message(self, message: str, websocket: WebSocket):
+        if id(websocket) not in self.active_connections:
+            # already disconnected (e.g. evicted), there's no one to send it to
+            return
+        queue = self.queues.get(id(websocket))
+        if queue is not None:
+            # only one connection, nothing to share, it's queued as it is
+            queue.put(message)
+        else:
+            await websocket.send_text(message)
+
+    async def broadcast(self, message: str):
+        """Send the message to every connection, and return the connections that
+        failed (they are already disconnected).
+        """
+        if self.backplane is not None:
+            await self.backplane.publish(None, message)
+        return await self._send_to(self.active_connections.values(), message)
+
+    async def publish(self, room: str, message: str):
+        """Send the message only to the connections in the room."""
+        if self.backplane is not None:
+            await self.backplane.publish(room, message)
+        return await self._send_to(self.rooms.get(room, {}).values(), message)
+
+    async def _send_to(self, connections: Iterable[WebSocket], message: str):
+        """Instead of a task per connection, a few "workers" take the next
+        connection from the same iterator until there are none left, so at most
+        `max_concurrent_sends` sends are running, even with thousands of clients.
+
+        With queues, the message is only added to each queue, the writers send
+        it. The connections returned are the ones closed because their queue
+        was full.
+        """
+        # a copy, the connections can change while we are sending
+        connections = list(connections)
+        prepared = PreparedMessage(message)
+        if self.queue_size is not None:
+            evicted = [
+                connection
+                for connection in connections
+                if not self.queues[id(connection)].put(prepared)
+            ]
+            # nothing above had to wait, let the writers run before we continue
+            await asyncio.sleep(0)
+            return evicted
+
+        pending = iter(connections)
+        failed: List[WebSocket] = []
+
+        async def worker():
+            for connection in pending:
+                try:
+                    await asyncio.wait_for(
+                        prepared.send(connection), timeout=self.send_timeout
+                    )
+                except Exception:
+                    failed.append(connection)
+
+        workers = min(self.max_concurrent_sends, len(connections))
+        await asyncio.gather(*(worker() for _ in range(workers)))
+        for connection in failed:
+            self.disconnect(connection)
+        await asyncio.gather(*(self._close_evicted(websocket) for websocket in failed))
+        return failed
+
+    async def _close_evicted(self, websocket: WebSocket):
+        try:
+            await asyncio.wait_for(
+                websocket.close(code=status.WS_1011_INTERNAL_ERROR),
+                timeout=self.send_timeout,
+            )
+        except Exception:
+            # most likely it was already closed, that's all we wanted
+            pass
+
+    def metrics(self):
+        depths = [queue.depth for queue in self.queues.values()]
+        return {
+            "connections": len(self.active_connections),
+            "rooms": len(self.rooms),
+            "queue_size": self.queue_size,
+            "overflow": self.overflow,
+            "queued_messages": sum(depths),
+            "max_queue_depth": max(depths, default=0),
+            "sent": self.sent + sum(queue.sent for queue in self.queues.values()),
+            "dropped": self.dropped
+            + sum(queue.dropped for queue in self.queues.values()),
+            "evicted": self.evicted
+            + sum(queue.evicted for queue in self.queues.values()),
+        }
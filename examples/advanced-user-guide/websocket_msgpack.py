@@ -0,0 +1,84 @@
+"""
+Binary **MessagePack** frames for WebSocket clients that ask for them.
+
+By default every message is a text frame, and `send_json()`/`receive_json()`
+write and parse JSON text. MessagePack encodes the same data (`dict`s, `list`s,
+`str`, numbers, etc.) in fewer bytes, and is faster to encode and decode.
+
+A client chooses it with the `Sec-WebSocket-Protocol` header, in JavaScript:
+
+    var ws = new WebSocket("ws://localhost:8000/ws", ["msgpack"]);
+    ws.binaryType = "arraybuffer";
+
+Declare the `websocket` parameter with `Depends(negotiated_websocket)`, and
+the endpoint gets a `CodecWebSocket`. The code of the endpoint doesn't change:
+after `accept()`, `send_text()`, `receive_text()`, `send_json()` and
+`receive_json()` use binary MessagePack frames if the client asked for
+`msgpack`, and text frames (and JSON) if it didn't.
+"""
+from typing import Any
+
+import msgpack
+from fastapi import WebSocket
+
+MSGPACK_SUBPROTOCOL = "msgpack"
+
+
+def pack(data: Any) -> bytes:
+    return msgpack.packb(data, use_bin_type=True)
+
+
+def unpack(data: bytes) -> Any:
+    return msgpack.unpackb(data, raw=False)
+
+
+class CodecWebSocket(WebSocket):
+    binary = False
+
+    async def accept(self, subprotocol: str = None):
+        if subprotocol is None and MSGPACK_SUBPROTOCOL in self.scope.get(
+            "subprotocols", []
+        ):
+            subprotocol = MSGPACK_SUBPROTOCOL
+        self.binary = subprotocol == MSGPACK_SUBPROTOCOL
+        await super().accept(subprotocol=subprotocol)
+
+    async def send_text(self, data: str):
+        if self.binary:
+            await self.send_bytes(pack(data))
+        else:
+            await super().send_text(data)
+
+    async def receive_text(self) -> str:
+        if self.binary:
+            return unpack(await self.receive_bytes())
+        return await super().receive_text()
+
+    async def send_json(self, data: Any, mode: str = "text"):
+        if self.binary:
+            await self.send_bytes(pack(data))
+        else:
+            await super().send_json(data, mode=mode)
+
+    async def receive_json(self, mode: str = "text") -> Any:
+        if self.binary:
+            return unpack(await self.receive_bytes())
+        return await super().receive_json(mode=mode)
+
+    async def send_prepared(self, prepared):
+        """Used by the `ConnectionManager` for broadcasts: the MessagePack frame
+        is also made only once for all the connections.
+        """
+        if self.binary:
+            await self.send(prepared.encoded(MSGPACK_SUBPROTOCOL, pack_asgi_message))
+        else:
+            await self.send(prepared.asgi_message)
+
+
+def pack_asgi_message(text: str):
+    return {"type": "websocket.send", "bytes": pack(text)}
+
+
+async def negotiated_websocket(websocket: WebSocket) -> CodecWebSocket:
+    """The same connection, as a `CodecWebSocket`."""
+    return CodecWebSocket(websocket.scope, websocket.receive, websocket.send)
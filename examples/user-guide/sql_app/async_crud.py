@@ -0,0 +1,77 @@
+"""The same functions as in `crud.py`, for an `AsyncSession`.
+
+The queries are written with `select()` and executed with `await db.execute()`.
+
+An `AsyncSession` can't load a relationship lazily (that would need an `await`
+when reading `user.items`), so `get_users` and `get_user` always load the items
+of the users with `selectinload`, and new users are created with an empty list
+of items.
+"""
+from typing import Optional
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+
+from . import models, schemas
+from .crud import ITEMS_COUNT, USERS_COUNT, increment_row_counts, items_count
+
+
+def _users():
+    return select(models.User).options(selectinload(models.User.items))
+
+
+async def get_user(db: AsyncSession, user_id: int):
+    result = await db.execute(_users().filter(models.User.id == user_id))
+    return result.scalars().first()
+
+
+async def get_user_by_email(db: AsyncSession, email: str):
+    result = await db.execute(_users().filter(models.User.email == email))
+    return result.scalars().first()
+
+
+async def get_users(
+    db: AsyncSession, skip: int = 0, limit: int = 100, after: Optional[int] = None
+):
+    return await _page(db, _users(), models.User.id, skip, limit, after)
+
+
+async def create_user(db: AsyncSession, user: schemas.UserCreate):
+    fake_hashed_password = user.password + "notreallyhashed"
+    db_user = models.User(
+        email=user.email, hashed_password=fake_hashed_password, items=[]
+    )
+    db.add(db_user)
+    await db.execute(increment_row_counts({USERS_COUNT: 1}))
+    await db.commit()
+    return db_user
+
+
+async def get_items(
+    db: AsyncSession, skip: int = 0, limit: int = 100, after: Optional[int] = None
+):
+    return await _page(db, select(models.Item), models.Item.id, skip, limit, after)
+
+
+async def create_user_item(
+    db: AsyncSession, item: schemas.ItemCreate, user_id: int
+):
+    db_item = models.Item(**item.dict(), owner_id=user_id)
+    db.add(db_item)
+    await db.execute(
+        increment_row_counts({ITEMS_COUNT: 1, items_count(user_id): 1})
+    )
+    await db.commit()
+    return db_item
+
+
+async def _page(db: AsyncSession, query, key_column, skip, limit, after):
+    # ordered by the key in both cases, the `X-Next-Cursor` of a page is the
+    # key of its last row
+    if after is not None:
+        query = query.filter(key_column > after)
+    else:
+        query = query.offset(skip)
+    result = await db.execute(query.order_by(key_column).limit(limit))
+    return result.scalars().all()
@@ -0,0 +1,38 @@
+"""
+The same SQLAlchemy parts as in `database.py`, but async.
+
+`create_async_engine` needs an async database driver, for SQLite that's
+`aiosqlite` (for PostgreSQL it could be `asyncpg`). That's why the URL starts
+with `sqlite+aiosqlite://`.
+
+We don't create a new `Base`, the models are the same ones in `models.py`, only
+the way we talk to the database changes.
+"""
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from .config import SQLiteProfile, settings
+from .database import tune_sqlite_connections
+
+if settings.sqlite_profile == SQLiteProfile.tuned:
+    engine = create_async_engine(
+        settings.async_database_url,
+        poolclass=AsyncAdaptedQueuePool,
+        pool_size=settings.sqlite_pool_size,
+        max_overflow=settings.sqlite_max_overflow,
+    )
+    # the `PRAGMA`s are set on the sync engine that runs behind the async one
+    tune_sqlite_connections(engine.sync_engine)
+else:
+    engine = create_async_engine(settings.async_database_url)
+
+"""
+`expire_on_commit=False` keeps the attributes of the objects after a `commit`.
+Otherwise, reading e.g. `db_user.id` after the `commit` would have to go to the
+database again, and with `AsyncSession` that can only happen with an `await`,
+not by reading an attribute.
+"""
+AsyncSessionLocal = sessionmaker(
+    engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
+)
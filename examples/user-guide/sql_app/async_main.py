@@ -0,0 +1,92 @@
+"""The same app as in `main.py`, with `async def` path operations.
+
+In `main.py` the path operations are normal `def` functions, so FastAPI runs
+each of them in a threadpool. While a query is waiting for the database, the
+request is holding one of the threads of that pool, and when all of them are
+busy, the next requests have to wait for one, even if they would be quick.
+
+Here, with an `AsyncSession`, we `await` the database instead, and while a
+query is waiting, the event loop can keep handling other requests, without
+using a thread.
+
+To use this app instead of the one in `main.py`, set `async_mode` in the
+settings (see `config.py` and `server.py`).
+"""
+from typing import List, Optional
+
+from fastapi import Depends, FastAPI, HTTPException, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import async_crud, models, schemas
+from .async_database import AsyncSessionLocal, engine
+from .pagination import decode_cursor, set_next_cursor
+
+app = FastAPI()
+
+
+@app.on_event("startup")
+async def create_tables():
+    # `create_all` is not async, `run_sync` runs it with the async connection
+    async with engine.begin() as conn:
+        await conn.run_sync(models.Base.metadata.create_all)
+
+
+# Dependency
+async def get_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+@app.post("/users/", response_model=schemas.User)
+async def create_user(
+    user: schemas.UserCreate, db: AsyncSession = Depends(get_db)
+):
+    db_user = await async_crud.get_user_by_email(db, email=user.email)
+    if db_user:
+        raise HTTPException(status_code=400, detail="Email already registered")
+    return await async_crud.create_user(db=db, user=user)
+
+
+@app.get("/users/", response_model=List[schemas.User])
+async def read_users(
+    response: Response,
+    skip: int = 0,
+    limit: int = 100,
+    after: Optional[str] = None,
+    db: AsyncSession = Depends(get_db),
+):
+    users = await async_crud.get_users(
+        db, skip=skip, limit=limit, after=decode_cursor(after)
+    )
+    set_next_cursor(response, users, limit)
+    return users
+
+
+@app.get("/users/{user_id}", response_model=schemas.User)
+async def read_user(user_id: int, db: AsyncSession = Depends(get_db)):
+    db_user = await async_crud.get_user(db, user_id=user_id)
+    if db_user is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    return db_user
+
+
+@app.post("/users/{user_id}/items", response_model=schemas.Item)
+async def create_item_for_user(
+    user_id: int, item: schemas.ItemCreate, db: AsyncSession = Depends(get_db)
+):
+    return await async_crud.create_user_item(db=db, item=item, user_id=user_id)
+
+
+@app.get("/items", response_model=List[schemas.Item])
+async def read_items(
+    response: Response,
+    skip: int = 0,
+    limit: int = 100,
+    after: Optional[str] = None,
+    db: AsyncSession = Depends(get_db),
+):
+    items = await async_crud.get_items(
+        db, skip=skip, limit=limit, after=decode_cursor(after)
+    )
+    set_next_cursor(response, items, limit)
+    return items
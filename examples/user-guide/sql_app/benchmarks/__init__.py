@@ -0,0 +1,87 @@
+"""Small, dependency-free benchmarks for the `sql_app` example.
+
+Each module can be run on its own from the `user-guide` directory, e.g.:
+`python -m sql_app.benchmarks.pagination`
+
+They work on a throwaway SQLite file in a temporary directory, so they never
+touch `sql_app.db`. Requests are sent straight to the ASGI app with
+`asgi_request`, without a server or a network in between, so the numbers only
+show the cost of the app itself.
+"""
+import os
+import statistics
+import tempfile
+import time
+from contextlib import contextmanager
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from ..database import Base
+
+
+@contextmanager
+def temporary_database(make_engine=None):
+    """Yield a `(engine, SessionLocal)` pair bound to a fresh SQLite file.
+
+    `make_engine(url)` creates the engine, by default a plain `create_engine`.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        url = "sqlite:///" + os.path.join(directory, "bench.db")
+        if make_engine is None:
+            engine = create_engine(url, connect_args={"check_same_thread": False})
+        else:
+            engine = make_engine(url)
+        Base.metadata.create_all(bind=engine)
+        try:
+            yield engine, sessionmaker(autocommit=False, autoflush=False, bind=engine)
+        finally:
+            engine.dispose()
+
+
+async def asgi_request(app, path: str, query_string: str = ""):
+    """Send a `GET` request to an ASGI `app`, return `(status, body)`."""
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "root_path": "",
+        "query_string": query_string.encode(),
+        "headers": [(b"host", b"benchmark")],
+        "client": ("127.0.0.1", 12345),
+        "server": ("benchmark", 80),
+    }
+    request_sent = False
+    status = None
+    body = []
+
+    async def receive():
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+        elif message["type"] == "http.response.body":
+            body.append(message.get("body", b""))
+
+    await app(scope, receive, send)
+    return status, b"".join(body)
+
+
+def measure(func, repeat: int = 20):
+    """Call `func` `repeat` times and return the median duration in milliseconds."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
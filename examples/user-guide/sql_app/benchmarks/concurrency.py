@@ -0,0 +1,104 @@
+"""Throughput of `def` + `Session` vs `async def` + `AsyncSession` with slow queries.
+
+`python -m sql_app.benchmarks.concurrency [concurrency] [query_ms]`
+
+Each request runs a query that takes `query_ms` milliseconds in the database
+(a `bench_sleep()` SQL function, to simulate a slow query), and `concurrency`
+requests are sent at the same time.
+
+The `def` path operation holds a thread of the threadpool while it waits, so
+the throughput stops growing once all the threads are busy. The `async def`
+one doesn't hold a thread of the threadpool while it waits.
+"""
+import asyncio
+import sys
+import time
+
+from fastapi import Depends, FastAPI
+from sqlalchemy import event, text
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import Session, sessionmaker
+
+from . import asgi_request, temporary_database
+
+SLOW_QUERY = text("SELECT bench_sleep(:ms)")
+
+
+def bench_sleep(ms):
+    time.sleep(ms / 1000)
+    return ms
+
+
+def add_bench_sleep(engine):
+    @event.listens_for(engine, "connect")
+    def connect(dbapi_connection, connection_record):
+        dbapi_connection.create_function("bench_sleep", 1, bench_sleep)
+
+
+def sync_app(SessionLocal, query_ms: int):
+    app = FastAPI()
+
+    def get_db():
+        db = SessionLocal()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    @app.get("/slow")
+    def slow(db: Session = Depends(get_db)):
+        return {"ms": db.execute(SLOW_QUERY, {"ms": query_ms}).scalar()}
+
+    return app
+
+
+def async_app(AsyncSessionLocal, query_ms: int):
+    app = FastAPI()
+
+    async def get_db():
+        async with AsyncSessionLocal() as db:
+            yield db
+
+    @app.get("/slow")
+    async def slow(db: AsyncSession = Depends(get_db)):
+        result = await db.execute(SLOW_QUERY, {"ms": query_ms})
+        return {"ms": result.scalar()}
+
+    return app
+
+
+async def load(app, concurrency: int, rounds: int = 3):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        results = await asyncio.gather(
+            *(asgi_request(app, "/slow") for _ in range(concurrency))
+        )
+        assert all(status == 200 for status, _ in results)
+    return concurrency * rounds / (time.perf_counter() - start)
+
+
+def main(concurrency: int = 200, query_ms: int = 20):
+    with temporary_database() as (engine, SessionLocal):
+        add_bench_sleep(engine)
+        async_engine = create_async_engine(
+            str(engine.url).replace("sqlite://", "sqlite+aiosqlite://")
+        )
+        add_bench_sleep(async_engine.sync_engine)
+        AsyncSessionLocal = sessionmaker(async_engine, class_=AsyncSession)
+
+        print(f"{concurrency} concurrent requests, {query_ms} ms per query")
+        sync_rps = asyncio.run(load(sync_app(SessionLocal, query_ms), concurrency))
+        print(f"def + Session:             {sync_rps:8.1f} requests/s")
+
+        async def run_async():
+            try:
+                return await load(async_app(AsyncSessionLocal, query_ms), concurrency)
+            finally:
+                await async_engine.dispose()
+
+        async_rps = asyncio.run(run_async())
+        print(f"async def + AsyncSession:  {async_rps:8.1f} requests/s")
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,61 @@
+"""Peak memory of exporting the `items` table, streamed vs as a list.
+
+`python -m sql_app.benchmarks.export [rows ...]`
+
+- `list`: what `read_items` does, all the rows as `schemas.Item`, then JSON.
+- `stream`: `crud.iter_items` + `export.stream_rows`, as in `/export/items`.
+
+The peak of the streamed export should stay about the same for any number of
+rows.
+"""
+import json
+import sys
+import tracemalloc
+
+from .. import crud, models, schemas
+from ..export import ExportFormat, stream_rows
+from . import temporary_database
+
+
+def export_list(db):
+    items = [schemas.Item.from_orm(item) for item in db.query(models.Item).all()]
+    return len(json.dumps([item.dict() for item in items]))
+
+
+def export_stream(db):
+    rows = crud.iter_items(db)
+    chunks = stream_rows(rows, crud.ITEM_EXPORT_COLUMNS, ExportFormat.ndjson)
+    return sum(len(chunk) for chunk in chunks)
+
+
+def peak_mib(func, db):
+    db.expunge_all()
+    tracemalloc.start()
+    func(db)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak / 1024 / 1024
+
+
+def main(*sizes: int):
+    sizes = sizes or (10_000, 100_000)
+    print(f"{'rows':>10} {'list MiB':>10} {'stream MiB':>10}")
+    for rows in sizes:
+        with temporary_database() as (_, SessionLocal):
+            db = SessionLocal()
+            db.bulk_insert_mappings(
+                models.Item,
+                [
+                    {"title": f"Item {i}", "description": "export", "owner_id": 1}
+                    for i in range(rows)
+                ],
+            )
+            db.commit()
+            stream = peak_mib(export_stream, db)
+            listed = peak_mib(export_list, db)
+            db.close()
+        print(f"{rows:>10} {listed:>10.1f} {stream:>10.1f}")
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,108 @@
+"""Cost per request of the different ways to give a request its session.
+
+`python -m sql_app.benchmarks.middleware [requests]`
+
+- `http middleware`: the previous `@app.middleware("http")` version, a session
+for every request, through `BaseHTTPMiddleware`.
+- `asgi middleware`: `DBSessionMiddleware`, a session only when it's used.
+- `get_db`: no middleware, the dependency with `yield` of the path operation.
+
+Each one is measured on a route that doesn't use the database and on one that
+reads a user.
+"""
+import asyncio
+import sys
+import time
+
+from fastapi import Depends, FastAPI, Request, Response
+from sqlalchemy.orm import Session
+
+from .. import crud, models
+from ..middleware import DBSessionMiddleware
+from . import asgi_request, temporary_database
+
+
+def http_middleware_app(SessionLocal):
+    app = FastAPI()
+
+    @app.middleware("http")
+    async def db_session_middleware(request: Request, call_next):
+        response = Response("Internal server error", status_code=500)
+        try:
+            request.state.db = SessionLocal()
+            response = await call_next(request)
+        finally:
+            request.state.db.close()
+        return response
+
+    add_state_routes(app)
+    return app
+
+
+def asgi_middleware_app(SessionLocal):
+    app = FastAPI()
+    app.add_middleware(DBSessionMiddleware, session_factory=SessionLocal)
+    add_state_routes(app)
+    return app
+
+
+def add_state_routes(app):
+    @app.get("/health")
+    def health():
+        return {"status": "ok"}
+
+    @app.get("/users/{user_id}")
+    def read_user(user_id: int, request: Request):
+        return {"email": crud.get_user(request.state.db, user_id=user_id).email}
+
+
+def get_db_app(SessionLocal):
+    app = FastAPI()
+
+    def get_db():
+        db = SessionLocal()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    @app.get("/health")
+    def health():
+        return {"status": "ok"}
+
+    @app.get("/users/{user_id}")
+    def read_user(user_id: int, db: Session = Depends(get_db)):
+        return {"email": crud.get_user(db, user_id=user_id).email}
+
+    return app
+
+
+async def run(app, path: str, requests: int):
+    start = time.perf_counter()
+    for _ in range(requests):
+        status, _ = await asgi_request(app, path)
+        assert status == 200
+    return (time.perf_counter() - start) / requests * 1_000_000
+
+
+def main(requests: int = 2000):
+    with temporary_database() as (_, SessionLocal):
+        db = SessionLocal()
+        db.add(models.User(email="bench@example.com", hashed_password="x"))
+        db.commit()
+        db.close()
+        print(f"{requests} sequential requests, microseconds per request")
+        print(f"{'':<16} {'/health':>10} {'/users/1':>10}")
+        for name, make_app in [
+            ("http middleware", http_middleware_app),
+            ("asgi middleware", asgi_middleware_app),
+            ("get_db", get_db_app),
+        ]:
+            app = make_app(SessionLocal)
+            health = asyncio.run(run(app, "/health", requests))
+            user = asyncio.run(run(app, "/users/1", requests))
+            print(f"{name:<16} {health:>10.1f} {user:>10.1f}")
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,50 @@
+"""Deep-page latency: `OFFSET` vs keyset (cursor) pagination.
+
+`python -m sql_app.benchmarks.pagination [rows]`
+
+With `OFFSET` the time grows with the page depth, with a cursor it stays flat.
+"""
+import sys
+
+from .. import crud, models
+from . import measure, temporary_database
+
+PAGE_SIZE = 100
+
+
+def seed(db, rows: int):
+    owner = models.User(email="owner@example.com", hashed_password="x")
+    db.add(owner)
+    db.flush()
+    db.bulk_insert_mappings(
+        models.Item,
+        [
+            {"title": f"Item {i}", "description": "benchmark", "owner_id": owner.id}
+            for i in range(rows)
+        ],
+    )
+    db.commit()
+
+
+def main(rows: int = 200_000):
+    with temporary_database() as (_, SessionLocal):
+        db = SessionLocal()
+        seed(db, rows)
+        print(f"{rows} items, page size {PAGE_SIZE}")
+        print(f"{'depth':>10} {'offset ms':>10} {'cursor ms':>10}")
+        depth = PAGE_SIZE
+        while depth < rows:
+            # the row right before the page starts has id == depth
+            offset_ms = measure(
+                lambda: crud.get_items(db, skip=depth, limit=PAGE_SIZE)
+            )
+            cursor_ms = measure(
+                lambda: crud.get_items(db, after=depth, limit=PAGE_SIZE)
+            )
+            print(f"{depth:>10} {offset_ms:>10.3f} {cursor_ms:>10.3f}")
+            depth *= 4
+        db.close()
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:]))
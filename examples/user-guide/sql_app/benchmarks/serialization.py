@@ -0,0 +1,75 @@
+"""`read_items` with 10k rows: SQLAlchemy models + `response_model` vs rows.
+
+`python -m sql_app.benchmarks.serialization [rows]`
+
+- `orm`: the previous `read_items`, `crud.get_items` validated by FastAPI with
+`response_model=List[schemas.Item]`.
+- `projection`: the current `read_items`, `crud.get_item_rows` returned in a
+`JSONResponse`.
+"""
+import asyncio
+import json
+import sys
+from typing import List
+
+from fastapi import Depends, FastAPI
+from fastapi.responses import JSONResponse
+from sqlalchemy.orm import Session
+
+from .. import crud, models, schemas
+from . import asgi_request, measure, temporary_database
+
+
+def make_app(SessionLocal):
+    app = FastAPI()
+
+    def get_db():
+        db = SessionLocal()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    @app.get("/orm", response_model=List[schemas.Item])
+    def read_items_orm(limit: int, db: Session = Depends(get_db)):
+        return crud.get_items(db, limit=limit)
+
+    @app.get("/projection", response_model=List[schemas.Item])
+    def read_items_projection(limit: int, db: Session = Depends(get_db)):
+        items = crud.get_item_rows(db, limit=limit)
+        return JSONResponse([item._asdict() for item in items])
+
+    return app
+
+
+def main(rows: int = 10_000):
+    with temporary_database() as (_, SessionLocal):
+        db = SessionLocal()
+        db.bulk_insert_mappings(
+            models.Item,
+            [
+                {"title": f"Item {i}", "description": "serialization", "owner_id": 1}
+                for i in range(rows)
+            ],
+        )
+        db.commit()
+        db.close()
+        app = make_app(SessionLocal)
+        query_string = f"limit={rows}"
+        bodies = {}
+        print(f"GET /items?limit={rows}, median of 10 requests")
+        for path in ("/orm", "/projection"):
+
+            def request():
+                status, bodies[path] = asyncio.run(
+                    asgi_request(app, path, query_string)
+                )
+                assert status == 200
+
+            print(f"{path[1:]:<12} {measure(request, repeat=10):8.1f} ms")
+        # both give the same response
+        assert json.loads(bodies["/orm"]) == json.loads(bodies["/projection"])
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:]))
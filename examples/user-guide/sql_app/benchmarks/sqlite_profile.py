@@ -0,0 +1,92 @@
+"""Mixed read/write load with the `default` and the `tuned` SQLite profiles.
+
+`python -m sql_app.benchmarks.sqlite_profile [readers] [writers] [seconds]`
+
+Reader threads keep reading random users with `crud.get_user` while writer
+threads keep creating items with `crud.create_user_item` (one `commit` each).
+"""
+import random
+import sys
+import threading
+import time
+
+from .. import crud, models, schemas
+from ..config import SQLiteProfile
+from ..database import create_sqlite_engine
+from . import temporary_database
+
+USERS = 1000
+
+
+def seed(SessionLocal):
+    db = SessionLocal()
+    db.bulk_insert_mappings(
+        models.User,
+        [
+            {"email": f"user{i}@example.com", "hashed_password": "x"}
+            for i in range(USERS)
+        ],
+    )
+    db.commit()
+    db.close()
+
+
+def run(SessionLocal, readers: int, writers: int, seconds: float):
+    stop = threading.Event()
+    counts = {"reads": 0, "writes": 0, "errors": 0}
+    lock = threading.Lock()
+
+    def worker(kind):
+        db = SessionLocal()
+        done = errors = 0
+        while not stop.is_set():
+            user_id = random.randint(1, USERS)
+            try:
+                if kind == "reads":
+                    crud.get_user(db, user_id=user_id)
+                    # end the read transaction, as a request would
+                    db.rollback()
+                else:
+                    item = schemas.ItemCreate(title="Mixed load")
+                    crud.create_user_item(db, item=item, user_id=user_id)
+                done += 1
+            except Exception:  # e.g. "database is locked"
+                db.rollback()
+                errors += 1
+        db.close()
+        with lock:
+            counts[kind] += done
+            counts["errors"] += errors
+
+    threads = [
+        threading.Thread(target=worker, args=(kind,))
+        for kind, number in [("reads", readers), ("writes", writers)]
+        for _ in range(number)
+    ]
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return {kind: count / seconds for kind, count in counts.items()}
+
+
+def main(readers: int = 8, writers: int = 2, seconds: float = 5.0):
+    print(f"{readers} readers, {writers} writers, {seconds:g} s per profile")
+    print(f"{'profile':<10} {'reads/s':>10} {'writes/s':>10} {'errors/s':>10}")
+    for profile in SQLiteProfile:
+        def make_engine(url):
+            return create_sqlite_engine(url, profile=profile)
+
+        with temporary_database(make_engine) as (_, SessionLocal):
+            seed(SessionLocal)
+            result = run(SessionLocal, readers, writers, seconds)
+        print(
+            f"{profile.value:<10} {result['reads']:>10.0f} "
+            f"{result['writes']:>10.0f} {result['errors']:>10.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main(*(type_(arg) for type_, arg in zip((int, int, float), sys.argv[1:])))
@@ -0,0 +1,81 @@
+"""An in-process cache with a maximum size and a time to live.
+
+It works like `functools.lru_cache`: when it is full, the entry that was used
+the longest time ago is dropped. But on top of that every entry expires after
+`ttl` seconds, and entries can be removed on demand (e.g. when the row they
+came from changes).
+
+Path operations declared with normal `def` run in a threadpool, so the cache
+can be used by several threads at the same time, that's why it has a lock.
+
+Anything with the same `get`, `set`, `delete` and `clear` methods can be used
+instead, e.g. `NullCache` to disable caching, or a client for an external cache
+shared by several processes.
+"""
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from typing import Any, Hashable, Tuple
+
+CacheInfo = namedtuple("CacheInfo", ["hits", "misses", "maxsize", "currsize"])
+
+MISSING = object()
+
+
+class TTLCache:
+    def __init__(self, maxsize: int = 1024, ttl: float = 60.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable):
+        """Return the cached value, or `MISSING` (`None` is a valid value)."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                return MISSING
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key: Hashable, value: Any):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key: Hashable):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = 0
+
+    def cache_info(self):
+        with self._lock:
+            return CacheInfo(self.hits, self.misses, self.maxsize, len(self._data))
+
+
+class NullCache:
+    """A cache that never stores anything, every `get` is a miss."""
+
+    def get(self, key: Hashable):
+        return MISSING
+
+    def set(self, key: Hashable, value: Any):
+        pass
+
+    def delete(self, key: Hashable):
+        pass
+
+    def clear(self):
+        pass
@@ -18,9 +18,15 @@ Create utility functions to:
 - Read multiple items
 """
 
-from sqlalchemy.orm import Session
+from enum import Enum
+from typing import Iterable, List, Optional, Tuple
+
+from sqlalchemy import func, text
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import Session, joinedload, noload, selectinload
 
 from . import models, schemas
+from .cache import MISSING, TTLCache
 
 
 def get_user(db: Session, user_id: int):
@@ -31,8 +37,140 @@ def get_user_by_email(db: Session, email: str):
     return db.query(models.User).filter(models.User.email == email).first()
 
 
-def get_users(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(models.User).offset(skip).limit(limit).all()
+"""Caching the reads of a single user.
+Users almost never change, but `read_user` and the duplicate check in
+`create_user` would go to the database on every request.
+
+`get_user_cached` and `get_user_by_email_cached` first look in `user_cache`,
+and only on a miss they call the normal `get_user` / `get_user_by_email`.
+
+- `("user", user_id)` stores the user as a `schemas.User` (not the SQLAlchemy
+model, that one belongs to the session of the request that read it).
+- `("email", email)` only stores the user ID, as an email always belongs to the
+same user. So there's only one entry to remove when a user changes.
+
+Not finding a user is cached too (as `None`), that's why creating a user has
+to remove its entries as well.
+
+`user_cache` can be replaced by any other cache, e.g. `cache.NullCache()` to
+disable it.
+"""
+user_cache = TTLCache(maxsize=1024, ttl=60.0)
+
+
+def get_user_cached(db: Session, user_id: int):
+    key = ("user", user_id)
+    user = user_cache.get(key)
+    if user is MISSING:
+        db_user = get_user(db, user_id=user_id)
+        user = None if db_user is None else schemas.User.from_orm(db_user)
+        user_cache.set(key, user)
+    return user
+
+
+def get_user_by_email_cached(db: Session, email: str):
+    key = ("email", email)
+    user_id = user_cache.get(key)
+    if user_id is MISSING:
+        db_user = get_user_by_email(db, email=email)
+        user_id = None if db_user is None else db_user.id
+        user_cache.set(key, user_id)
+    if user_id is None:
+        return None
+    return get_user_cached(db, user_id=user_id)
+
+
+def invalidate_user(user_id: Optional[int] = None, email: Optional[str] = None):
+    if user_id is not None:
+        user_cache.delete(("user", user_id))
+    if email is not None:
+        user_cache.delete(("email", email))
+
+
+class ItemsLoading(str, Enum):
+    """How `get_users` loads the `items` relationship of each user.
+
+    By default `relationship()` is lazy: the items of a user are fetched the
+    first time `user.items` is accessed. When Pydantic (`orm_mode`) builds the
+    response for a page of 100 users, that means 1 query for the users plus 1
+    query per user (the "N+1" problem).
+
+    - `selectin`: 1 extra query for the whole page, `WHERE owner_id IN (...)`.
+    - `joined`: a single query, with a `LEFT OUTER JOIN` on `items`.
+    - `none`: don't load items at all, every user gets an empty list.
+    """
+    selectin = "selectin"
+    joined = "joined"
+    none = "none"
+
+
+_ITEMS_LOADERS = {
+    ItemsLoading.selectin: selectinload,
+    ItemsLoading.joined: joinedload,
+    ItemsLoading.none: noload,
+}
+
+
+def get_users(
+    db: Session,
+    skip: int = 0,
+    limit: int = 100,
+    after: Optional[int] = None,
+    items: ItemsLoading = ItemsLoading.selectin,
+):
+    loader = _ITEMS_LOADERS[items]
+    query = db.query(models.User).options(loader(models.User.items))
+    if after is not None:
+        return _keyset(query, models.User.id, after, limit)
+    return query.order_by(models.User.id).offset(skip).limit(limit).all()
+
+
+"""Keyset (cursor) pagination.
+With `.offset(skip)` the database still has to walk over (and throw away) the
+first `skip` rows, so each page gets slower the deeper we go.
+
+If instead we remember the `id` of the last row we sent, the next page is just:
+`WHERE id > :after ORDER BY id LIMIT :limit`
+...and as `id` is the primary key, the database can jump straight to it using
+the index, so every page costs about the same.
+
+The `skip` pages are ordered by `id` too: the `X-Next-Cursor` of a page is the
+`id` of its last row, that only works if it's also the largest one.
+"""
+def _keyset(query, key_column, after: int, limit: int):
+    return query.filter(key_column > after).order_by(key_column).limit(limit).all()
+
+
+"""Keeping the row counts (see `models.RowCount`).
+`increment_row_counts` adds to several counters with a single "upsert"
+statement: the counter is created if it doesn't exist yet, otherwise its value
+is increased. The statement is executed in the same session (and transaction)
+that inserts the rows, before the `commit`.
+
+`insert` is the SQLite one, as it has `on_conflict_do_update`. The PostgreSQL
+`insert` (`sqlalchemy.dialects.postgresql`) has the same method.
+"""
+USERS_COUNT = "users"
+ITEMS_COUNT = "items"
+
+
+def items_count(owner_id: int):
+    return f"items:owner_id={owner_id}"
+
+
+def increment_row_counts(counts: dict):
+    statement = insert(models.RowCount).values(
+        [{"name": name, "count": count} for name, count in counts.items()]
+    )
+    return statement.on_conflict_do_update(
+        index_elements=[models.RowCount.name],
+        set_={"count": models.RowCount.count + statement.excluded.count},
+    )
+
+
+def get_row_count(db: Session, name: str) -> int:
+    row_count = db.get(models.RowCount, name)
+    return 0 if row_count is None else row_count.count
 
 
 """Creating utility functions to create data.
@@ -47,18 +185,210 @@ def create_user(db: Session, user: schemas.UserCreate):
     fake_hashed_password = user.password + "notreallyhashed"
     db_user = models.User(email=user.email, hashed_password=fake_hashed_password)
     db.add(db_user)
-    db.commmit()
+    db.execute(increment_row_counts({USERS_COUNT: 1}))
+    db.commit()
     db.refresh(db_user)
+    invalidate_user(user_id=db_user.id, email=db_user.email)
     return db_user
 
 
-def get_items(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(models.Item).offset(skip).limit(limit).all()
+"""Creating many rows at once.
+Calling `create_user` in a loop would `commit` once per row, and each `commit`
+is a separate transaction (for SQLite, a separate write to disk).
+
+Instead, we insert the rows in chunks of `BULK_CHUNK_SIZE` with
+`bulk_insert_mappings` (sent to the database as a single `executemany`), and
+`commit` only once at the end, so either all the rows are saved or none.
+
+The chunks also keep each `IN (...)` below the maximum number of parameters
+SQLite accepts in a single statement (999 in older versions).
+"""
+BULK_CHUNK_SIZE = 500
+
+
+def _chunks(values: List, size: int = BULK_CHUNK_SIZE):
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+def get_users_by_emails(db: Session, emails: Iterable[str]):
+    """Read all the users with any of the `emails`, with one `IN (...)` query
+    per chunk instead of one `get_user_by_email` per email.
+    """
+    users = []
+    for chunk in _chunks(list(emails)):
+        users.extend(
+            db.query(models.User)
+            .options(noload(models.User.items))
+            .filter(models.User.email.in_(chunk))
+            .all()
+        )
+    return users
+
+
+def create_users(db: Session, users: List[schemas.UserCreate]):
+    mappings = [
+        {"email": user.email, "hashed_password": user.password + "notreallyhashed"}
+        for user in users
+    ]
+    for chunk in _chunks(mappings):
+        db.bulk_insert_mappings(models.User, chunk)
+    db.execute(increment_row_counts({USERS_COUNT: len(mappings)}))
+    db.commit()
+    # `executemany` doesn't give us back the generated IDs, but the emails are
+    # unique, so we can read the new users back by email
+    emails = [user.email for user in users]
+    by_email = {user.email: user for user in get_users_by_emails(db, emails)}
+    for db_user in by_email.values():
+        invalidate_user(user_id=db_user.id, email=db_user.email)
+    return [by_email[email] for email in emails]
+
+
+def get_items(
+    db: Session, skip: int = 0, limit: int = 100, after: Optional[int] = None
+):
+    query = db.query(models.Item)
+    if after is not None:
+        return _keyset(query, models.Item.id, after, limit)
+    return query.order_by(models.Item.id).offset(skip).limit(limit).all()
+
+
+"""A faster way to read a page of items, for `read_items`.
+
+`get_items` creates a SQLAlchemy `Item` for each row (and adds it to the
+identity map of the session), and then FastAPI gives each of them to
+`schemas.Item`, that reads and validates every attribute again.
+
+`get_item_rows` only selects the columns that `schemas.Item` has, and returns
+plain rows. Each one can be converted directly to a `dict` with `._asdict()`.
+"""
+def _schema_columns(model, schema):
+    return [getattr(model, name) for name in schema.__fields__]
+
+
+def get_item_rows(
+    db: Session,
+    skip: int = 0,
+    limit: int = 100,
+    after: Optional[int] = None,
+    owner_id: Optional[int] = None,
+):
+    query = db.query(*_schema_columns(models.Item, schemas.Item))
+    if owner_id is not None:
+        query = query.filter(models.Item.owner_id == owner_id)
+    if after is not None:
+        return _keyset(query, models.Item.id, after, limit)
+    return query.order_by(models.Item.id).offset(skip).limit(limit).all()
 
 
 def create_user_item(db: Session, item: schemas.ItemCreate, user_id: int):
     db_item = models.Item(**item.dict(), owner_id=user_id)
     db.add(db_item)
+    db.execute(increment_row_counts({ITEMS_COUNT: 1, items_count(user_id): 1}))
     db.commit()
     db.refresh(db_item)
+    # the cached user has a list of its items
+    invalidate_user(user_id=user_id)
     return db_item
+
+
+def create_user_items(
+    db: Session, items: List[schemas.ItemCreate], user_id: int
+):
+    """Items don't have a unique column we could read them back with, like the
+    emails of the users. But the IDs only grow: the new items of this user are
+    the ones with an `id` greater than the largest one before the `INSERT`s,
+    read back with a single query, in the order they were inserted.
+
+    Asking `bulk_insert_mappings` for the IDs instead (`return_defaults=True`)
+    would make it insert the rows one by one, not with an `executemany`.
+    """
+    mappings = [{**item.dict(), "owner_id": user_id} for item in items]
+    max_id_before = db.query(func.max(models.Item.id)).scalar() or 0
+    for chunk in _chunks(mappings):
+        db.bulk_insert_mappings(models.Item, chunk)
+    db.execute(
+        increment_row_counts(
+            {ITEMS_COUNT: len(mappings), items_count(user_id): len(mappings)}
+        )
+    )
+    db.commit()
+    invalidate_user(user_id=user_id)
+    return (
+        db.query(models.Item)
+        .filter(models.Item.owner_id == user_id, models.Item.id > max_id_before)
+        .order_by(models.Item.id)
+        .limit(len(mappings))
+        .all()
+    )
+
+
+"""Searching items with the `items_fts` full-text index (see `models.py`).
+
+`bm25()` gives a lower (more negative) number to the more relevant rows, so
+sorting by it in ascending order gives the best matches first.
+
+Each word in `q` is quoted before giving it to `MATCH`, so that characters with
+a special meaning in the FTS5 query syntax (like `"`, `*`, `-` or `OR`) are
+searched as normal text. The result has the items with all the words.
+"""
+SEARCH_ITEMS = text(
+    """
+    SELECT * FROM (
+        SELECT items.id, items.title, items.description, items.owner_id,
+               bm25(items_fts) AS rank
+        FROM items_fts JOIN items ON items.id = items_fts.rowid
+        WHERE items_fts MATCH :query
+    )
+    WHERE :after_rank IS NULL
+       OR rank > :after_rank
+       OR (rank = :after_rank AND id > :after_id)
+    ORDER BY rank, id
+    LIMIT :limit
+    """
+)
+
+
+def search_items(
+    db: Session,
+    q: str,
+    limit: int = 100,
+    after: Optional[Tuple[float, int]] = None,
+):
+    query = " ".join('"' + word.replace('"', '""') + '"' for word in q.split())
+    if not query:
+        return []
+    after_rank, after_id = after if after is not None else (None, None)
+    return db.execute(
+        SEARCH_ITEMS,
+        {
+            "query": query,
+            "after_rank": after_rank,
+            "after_id": after_id,
+            "limit": limit,
+        },
+    ).all()
+
+
+"""Reading a whole table for an export (see `export.py`).
+
+We only ask for the columns (not the SQLAlchemy models), so the session
+doesn't keep every row in its identity map, and `yield_per` makes SQLAlchemy
+fetch the rows from the database in batches of `EXPORT_BATCH_SIZE` instead of
+all at once.
+"""
+EXPORT_BATCH_SIZE = 1000
+USER_EXPORT_COLUMNS = ("id", "email", "is_active")
+ITEM_EXPORT_COLUMNS = ("id", "title", "description", "owner_id")
+
+
+def iter_users(db: Session):
+    columns = [getattr(models.User, name) for name in USER_EXPORT_COLUMNS]
+    query = db.query(*columns).order_by(models.User.id)
+    return query.yield_per(EXPORT_BATCH_SIZE)
+
+
+def iter_items(db: Session):
+    columns = [getattr(models.Item, name) for name in ITEM_EXPORT_COLUMNS]
+    query = db.query(*columns).order_by(models.Item.id)
+    return query.yield_per(EXPORT_BATCH_SIZE)
@@ -2,9 +2,12 @@
 Create the SQLAlchemy parts
 """
 # Import the SQLAlchemy parts
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool
+
+from .config import SQLiteProfile, settings
 
 """
 "connecting" to a SQLite database (opening a file with SQLite database)
@@ -22,9 +25,53 @@ will be later used in other places
 The argument `connect_args={"check_same_thread":False}`
 ...is needed only for SQLite. It's not needed for other databases.
 """
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
-)
+def create_sqlite_engine(
+    url: str, profile: SQLiteProfile = settings.sqlite_profile
+):
+    if profile == SQLiteProfile.tuned:
+        engine = create_engine(
+            url,
+            connect_args={"check_same_thread": False},
+            poolclass=QueuePool,
+            pool_size=settings.sqlite_pool_size,
+            max_overflow=settings.sqlite_max_overflow,
+        )
+        tune_sqlite_connections(engine)
+        return engine
+    return create_engine(url, connect_args={"check_same_thread": False})
+
+
+"""THE `tuned` SQLITE PROFILE
+By default SQLite uses a "rollback journal": while a transaction is writing,
+nobody else can read the database. And each `commit` waits until the data is
+safely on disk (`synchronous=FULL`).
+
+With `journal_mode=WAL` ("write-ahead log") readers don't block writers and
+writers don't block readers. And with WAL, `synchronous=NORMAL` is still safe
+from corruption (a power loss could only lose the last commits).
+
+`cache_size` (negative means KiB) and `mmap_size` (bytes) let SQLite keep
+more of the database in memory.
+
+These `PRAGMA`s are set per connection, that's why they are executed on the
+`connect` event of the engine, for every new connection. And a `QueuePool`
+keeps those connections open between requests, instead of opening (and
+configuring) a new one every time.
+
+It's selected in the settings with `SQL_APP_SQLITE_PROFILE=tuned`.
+"""
+def tune_sqlite_connections(engine):
+    @event.listens_for(engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute(f"PRAGMA cache_size=-{settings.sqlite_cache_size_kib:d}")
+        cursor.execute(f"PRAGMA mmap_size={settings.sqlite_mmap_size:d}")
+        cursor.close()
+
+
+engine = create_sqlite_engine(SQLALCHEMY_DATABASE_URL)
 
 """
 Each instance of the `SessionLocal` class will be a database session. The class itself is not a database session yet.
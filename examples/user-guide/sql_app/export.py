@@ -0,0 +1,66 @@
+"""Streaming a whole table as NDJSON or CSV.
+
+Returning a `list` from a *path operation* means having every row in memory
+(as SQLAlchemy models, then as Pydantic models, then as JSON) before the first
+byte is sent.
+
+Here, the rows are read from the database in batches (`yield_per`), each row is
+converted to text as soon as it arrives, and the text is sent with a
+`StreamingResponse` in chunks of about `CHUNK_SIZE` bytes. So only one batch of
+rows and one chunk of text are in memory at any time, however big the table is.
+
+- NDJSON ("newline delimited JSON"): one JSON object per line.
+- CSV: a header line with the column names, then one line per row.
+"""
+import csv
+import io
+import itertools
+import json
+from enum import Enum
+from typing import Iterable, Iterator, Sequence
+
+CHUNK_SIZE = 64 * 1024
+
+
+class ExportFormat(str, Enum):
+    ndjson = "ndjson"
+    csv = "csv"
+
+
+MEDIA_TYPES = {
+    ExportFormat.ndjson: "application/x-ndjson",
+    ExportFormat.csv: "text/csv",
+}
+
+
+def _ndjson_lines(rows: Iterable, columns: Sequence[str]) -> Iterator[str]:
+    for row in rows:
+        yield json.dumps(dict(zip(columns, row))) + "\n"
+
+
+def _csv_lines(rows: Iterable, columns: Sequence[str]) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in itertools.chain([columns], rows):
+        writer.writerow(row)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+
+def stream_rows(
+    rows: Iterable, columns: Sequence[str], export_format: ExportFormat
+) -> Iterator[bytes]:
+    """Convert `rows` (tuples with the values of `columns`) to text, in chunks."""
+    lines = _csv_lines if export_format == ExportFormat.csv else _ndjson_lines
+    chunk = []
+    size = 0
+    for line in lines(rows, columns):
+        chunk.append(line)
+        size += len(line)
+        if size >= CHUNK_SIZE:
+            yield "".join(chunk).encode()
+            chunk = []
+            size = 0
+    if chunk:
+        yield "".join(chunk).encode()
@@ -1,31 +1,38 @@
 """Main FastAPI app
 """
 
-from typing import List
+from collections import Counter
+from typing import List, Optional
 
-from fastapi import Depends, FastAPI, HTTPException, Request, Response
+from fastapi import Depends, FastAPI, HTTPException, Response
+from fastapi.responses import JSONResponse, StreamingResponse
 from sqlalchemy.orm import Session
 
 from . import crud, models, schemas
 from .database import SessionLocal, engine
+from .export import MEDIA_TYPES, ExportFormat, stream_rows
+from .middleware import DBSessionMiddleware
+from .pagination import (
+    TOTAL_COUNT_HEADER,
+    decode_cursor,
+    decode_rank_cursor,
+    set_next_cursor,
+    set_next_rank_cursor,
+)
 
 # creating the database tables
 models.Base.metadata.create_all(bind=engine)
 
 app = FastAPI()
 
-"""The middleware will create a new SQLAlchemy `SessionLocal` for each request, add it to the request and then close it once the request is finished
-"""
-@app.middleware("http")
-async def db_session_middleware(request: Request, call_next):
-    response = Response("Internal server error", status_code=500)
-    try:
-        request.state.db = SessionLocal()
-        response = await call_next(request)
-    finally:
-        request.state.db.close()
-    return response
+"""The middleware will give each request its own SQLAlchemy `SessionLocal` in
+`request.state.db` and close it once the request is finished.
 
+`DBSessionMiddleware` is a plain ASGI middleware (see `middleware.py`) instead
+of `@app.middleware("http")`, and it only creates the session the first time
+`request.state.db` is used.
+"""
+app.add_middleware(DBSessionMiddleware, session_factory=SessionLocal)
 
 
 """Using the `SessionLocal` class in the `sql_app/databases.py` file to create a
@@ -64,12 +71,35 @@ With that, we can just call `crud.get_user` directly from inside of the *path op
 """
 @app.post("/users/", response_model=schemas.User)
 def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
-    db_user = crud.get_user_by_email(db, email=user.email)
+    db_user = crud.get_user_by_email_cached(db, email=user.email)
     if db_user:
         raise HTTPException(status_code=400, detail="Email already registered")
     return crud.create_user(db=db, user=user)
 
 
+"""BULK CREATION
+Accepting a `list` of users in one request means an importer doesn't need one
+HTTP call (and one transaction) per user.
+
+All the emails are checked with a single query, and also against each other,
+before anything is inserted.
+"""
+@app.post("/users/bulk", response_model=List[schemas.User])
+def create_users(users: List[schemas.UserCreate], db: Session = Depends(get_db)):
+    emails = [user.email for user in users]
+    duplicated = {email for email, count in Counter(emails).items() if count > 1}
+    registered = {user.email for user in crud.get_users_by_emails(db, emails)}
+    if duplicated or registered:
+        raise HTTPException(
+            status_code=400,
+            detail={
+                "message": "Email already registered",
+                "emails": sorted(duplicated | registered),
+            },
+        )
+    return crud.create_users(db=db, users=users)
+
+
 """Using SQLAlchemy code inside of the *path operation function* and in the dependency, and, in turn, it will go and communicate with an external database.
 
 That could potentially require some "waiting".
@@ -82,14 +112,27 @@ But as SQLAlchemy doesn't have compatibility for using `await` directly, as woul
 Then we should declare the *path operation functions* and the dependency without `async def`, just with normal `def`.
 """
 @app.get("/users/", response_model=List[schemas.User])
-def read_users(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    users = crud.get_users(db, skip=skip, limit=limit)
+def read_users(
+    response: Response,
+    skip: int = 0,
+    limit: int = 100,
+    after: Optional[str] = None,
+    items: crud.ItemsLoading = crud.ItemsLoading.selectin,
+    db: Session = Depends(get_db),
+):
+    users = crud.get_users(
+        db, skip=skip, limit=limit, after=decode_cursor(after), items=items
+    )
+    set_next_cursor(response, users, limit)
+    response.headers[TOTAL_COUNT_HEADER] = str(
+        crud.get_row_count(db, crud.USERS_COUNT)
+    )
     return users
 
 
 @app.get("/users/{user_id}", response_model=schemas.User)
 def read_user(user_id: int, db: Session = Depends(get_db)):
-    db_user = crud.get_user(db, user_id=user_id)
+    db_user = crud.get_user_cached(db, user_id=user_id)
     if db_user is None:
         raise HTTPException(status_code=404, detail="User not found")
     return db_user
@@ -102,10 +145,101 @@ def create_item_for_user(
     return crud.create_user_item(db=db, item=item, user_id=user_id)
 
 
+@app.post("/users/{user_id}/items/bulk", response_model=List[schemas.Item])
+def create_items_for_user(
+    user_id: int, items: List[schemas.ItemCreate], db: Session = Depends(get_db)
+):
+    return crud.create_user_items(db=db, items=items, user_id=user_id)
+
+
 @app.get("/items", response_model=List[schemas.Item])
-def read_items(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    items = crud.get_items(db, skip=skip, limit=limit)
+def read_items(
+    skip: int = 0,
+    limit: int = 100,
+    after: Optional[str] = None,
+    owner_id: Optional[int] = None,
+    db: Session = Depends(get_db),
+):
+    """The items are read as plain rows with only the columns of `schemas.Item`
+    (`crud.get_item_rows`), and returned in a `JSONResponse`.
+
+    When a *path operation* returns a `Response` FastAPI sends it as is, so the
+    data is not validated again with the `response_model`. It's still declared,
+    for the docs, and the rows have exactly the fields of `schemas.Item`.
+    """
+    items = crud.get_item_rows(
+        db,
+        skip=skip,
+        limit=limit,
+        after=decode_cursor(after),
+        owner_id=owner_id,
+    )
+    json_response = JSONResponse([item._asdict() for item in items])
+    set_next_cursor(json_response, items, limit)
+    if owner_id is None:
+        total = crud.get_row_count(db, crud.ITEMS_COUNT)
+    else:
+        total = crud.get_row_count(db, crud.items_count(owner_id))
+    json_response.headers[TOTAL_COUNT_HEADER] = str(total)
+    return json_response
+
+
+@app.get("/items/search", response_model=List[schemas.Item])
+def search_items(
+    response: Response,
+    q: str,
+    limit: int = 100,
+    after: Optional[str] = None,
+    db: Session = Depends(get_db),
+):
+    """Full-text search in the `title` and `description` of the items, the most
+    relevant first. The next page is in the `X-Next-Cursor` header.
+    """
+    items = crud.search_items(
+        db, q=q, limit=limit, after=decode_rank_cursor(after)
+    )
+    set_next_rank_cursor(response, items, limit)
     return items
 
+
+"""EXPORTS
+The whole table, streamed row by row (see `export.py`), as NDJSON or CSV.
+
+The session from `get_db` is only closed after the response has been sent, so
+it's still open while the rows are being streamed.
+"""
+@app.get("/export/users")
+def export_users(
+    format: ExportFormat = ExportFormat.ndjson, db: Session = Depends(get_db)
+):
+    rows = crud.iter_users(db)
+    return StreamingResponse(
+        stream_rows(rows, crud.USER_EXPORT_COLUMNS, format),
+        media_type=MEDIA_TYPES[format],
+    )
+
+
+@app.get("/export/items")
+def export_items(
+    format: ExportFormat = ExportFormat.ndjson, db: Session = Depends(get_db)
+):
+    rows = crud.iter_items(db)
+    return StreamingResponse(
+        stream_rows(rows, crud.ITEM_EXPORT_COLUMNS, format),
+        media_type=MEDIA_TYPES[format],
+    )
+
+
+"""CURSOR PAGINATION
+`skip` and `limit` still work as before. But every full page also comes with an
+`X-Next-Cursor` header, and passing it back as `?after=<cursor>` gives the next
+page using keyset pagination (`WHERE id > ...`) instead of `OFFSET`, so deep
+pages are as fast as the first one.
+
+The total number of users or items (of all the pages) is in the
+`X-Total-Count` header. It's read from the row counts (`models.RowCount`), not
+counted with `COUNT(*)` on every request.
+"""
+
 """
 """
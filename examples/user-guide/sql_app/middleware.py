@@ -0,0 +1,58 @@
+"""A database session middleware written directly as an ASGI application.
+
+`@app.middleware("http")` is built on Starlette's `BaseHTTPMiddleware`. It is
+simple to write, but it runs the rest of the app in a separate task, and it
+has to read the body of the response through a queue to give us a `response`
+object, even for `StreamingResponse`s.
+
+An ASGI middleware is just a class that receives `scope`, `receive` and `send`
+and calls the next app with them, so none of that happens.
+
+On top of that, the session is only created the first time a request uses
+`request.state.db`. Requests that never touch the database (like `/docs` or a
+health check) don't create one at all.
+"""
+from typing import Callable
+
+from sqlalchemy.orm import Session
+
+
+class LazySessionState(dict):
+    """The `dict` behind `request.state` (Starlette keeps it in `scope["state"]`).
+
+    Reading `request.state.db` does `state["db"]`, and when the key is not
+    there yet, `dict` calls `__missing__`, which is where the session is made.
+    """
+
+    def __init__(self, session_factory: Callable[[], Session], *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.session_factory = session_factory
+
+    def __missing__(self, key):
+        if key != "db":
+            raise KeyError(key)
+        session = self["db"] = self.session_factory()
+        return session
+
+
+class DBSessionMiddleware:
+    def __init__(self, app, session_factory: Callable[[], Session]):
+        self.app = app
+        self.session_factory = session_factory
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        state = LazySessionState(self.session_factory, scope.get("state", {}))
+        scope["state"] = state
+        try:
+            # this only returns once the whole response (including the body of
+            # a `StreamingResponse`) has been sent, so the session is still
+            # open while the response is streamed
+            await self.app(scope, receive, send)
+        finally:
+            # `pop` doesn't call `__missing__`, so this doesn't create a session
+            session = state.pop("db", None)
+            if session is not None:
+                session.close()
@@ -1,7 +1,15 @@
 """Creating the database models
 """
 # creating all the model(class) attributes
-from sqlalchemy import Boolean, Column, ForeignKey, Integer, String
+from sqlalchemy import (
+    Boolean,
+    Column,
+    ForeignKey,
+    Integer,
+    String,
+    event,
+    select,
+)
 # creating the relationships, using `relationship` provided by SQLAlchemy ORM
 from sqlalchemy.orm import relationship
 
@@ -52,3 +60,109 @@ And when accessing the attribute `owner` in an `Item`, it will contain a `User`
 SQLAlchemy model from the `users` table. It will use the `owner_id` attribute/
 column with its foreign key to know which record to get from the `users` table.
 """
+
+
+"""FULL-TEXT SEARCH
+The `index=True` in `title` and `description` creates normal (B-tree) indexes.
+They help to find an exact value, or values that start with some text, but not
+a word somewhere in the middle of the text (`LIKE '%word%'` reads every row).
+
+SQLite has a full-text search extension, FTS5. An FTS5 "virtual table" keeps an
+index of all the words in the text, so we can find the rows with some words
+(`MATCH`) and sort them by how relevant they are (`bm25()`).
+
+`items_fts` only stores the index, the text itself is read from the `items`
+table (`content='items'`). And the triggers keep the index updated on every
+`INSERT`, `UPDATE` and `DELETE` in `items`, including the ones done by
+`crud.create_user_item`.
+
+It's created after `Base.metadata.create_all()`. If the database already
+existed, with some items, the index is filled with them (`'rebuild'`).
+
+`Base.metadata.drop_all()` doesn't know about `items_fts`, it stays, but
+dropping `items` drops its triggers. That's why every statement has
+`IF NOT EXISTS`, and the index is rebuilt whenever any of them was missing.
+"""
+ITEMS_FTS_DDL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS items_fts USING fts5(
+        title, description, content='items', content_rowid='id'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS items_fts_insert AFTER INSERT ON items BEGIN
+        INSERT INTO items_fts(rowid, title, description)
+        VALUES (new.id, new.title, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS items_fts_delete AFTER DELETE ON items BEGIN
+        INSERT INTO items_fts(items_fts, rowid, title, description)
+        VALUES ('delete', old.id, old.title, old.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS items_fts_update AFTER UPDATE ON items BEGIN
+        INSERT INTO items_fts(items_fts, rowid, title, description)
+        VALUES ('delete', old.id, old.title, old.description);
+        INSERT INTO items_fts(rowid, title, description)
+        VALUES (new.id, new.title, new.description);
+    END
+    """,
+    "INSERT INTO items_fts(items_fts) VALUES ('rebuild')",
+]
+
+
+@event.listens_for(Base.metadata, "after_create")
+def create_items_fts(target, connection, **kw):
+    if connection.dialect.name != "sqlite":
+        return
+    existing = {
+        name
+        for (name,) in connection.exec_driver_sql(
+            "SELECT name FROM sqlite_master WHERE name IN "
+            "('items_fts', 'items_fts_insert', 'items_fts_delete', 'items_fts_update')"
+        )
+    }
+    if len(existing) < 4:
+        for statement in ITEMS_FTS_DDL:
+            connection.exec_driver_sql(statement)
+
+
+class RowCount(Base):
+    """ROW COUNTS
+    `SELECT COUNT(*) FROM items` has to go through the whole table (or a whole
+    index) every time. As we only need the total number of rows to show it to
+    the clients, we keep it updated in this table instead, one row per counter:
+    - `users`
+    - `items`
+    - `items:owner_id=<id>`, the items of each user
+
+    The counters are updated by the `crud` functions that create rows, in the
+    same transaction as the new rows, so both are saved together or not at all.
+    Reading one of them is a lookup by primary key.
+    """
+    __tablename__ = "row_counts"
+
+    name = Column(String, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+
+
+"""When the table is created in a database that already has users and items,
+the counters start with the real numbers, counted once.
+"""
+@event.listens_for(Base.metadata, "after_create")
+def init_row_counts(target, connection, **kw):
+    if connection.execute(select(RowCount.name).limit(1)).first() is not None:
+        return
+    connection.exec_driver_sql(
+        """
+        INSERT INTO row_counts (name, count)
+        SELECT 'users', COUNT(*) FROM users
+        UNION ALL
+        SELECT 'items', COUNT(*) FROM items
+        UNION ALL
+        SELECT 'items:owner_id=' || owner_id, COUNT(*) FROM items
+        WHERE owner_id IS NOT NULL GROUP BY owner_id
+        """
+    )
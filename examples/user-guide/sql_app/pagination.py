@@ -0,0 +1,71 @@
+"""Opaque cursors for keyset pagination.
+
+The client doesn't need to know that a cursor is just the `id` of the last row
+it received, so we hand it out encoded as a URL-safe token. That way we are
+free to change what goes inside it later (e.g. add a sort column) without
+breaking anybody.
+"""
+import base64
+import binascii
+from typing import Optional, Tuple
+
+from fastapi import HTTPException
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+TOTAL_COUNT_HEADER = "X-Total-Count"
+
+
+def _encode(value: str) -> str:
+    return base64.urlsafe_b64encode(value.encode()).decode().rstrip("=")
+
+
+def _decode(cursor: str) -> str:
+    padded = cursor + "=" * (-len(cursor) % 4)
+    return base64.urlsafe_b64decode(padded.encode()).decode()
+
+
+def encode_cursor(last_id: int) -> str:
+    return _encode(str(last_id))
+
+
+def decode_cursor(cursor: Optional[str]) -> Optional[int]:
+    """Return the `id` stored in the cursor, or `None` when no cursor was sent.
+    A token that we didn't create is a client error, so we answer with a `400`.
+    """
+    if cursor is None:
+        return None
+    try:
+        return int(_decode(cursor))
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+"""Search results are sorted by relevance (`rank`) and then by `id`, so to know
+where the next page starts, the cursor needs both.
+"""
+def encode_rank_cursor(rank: float, last_id: int) -> str:
+    return _encode(f"{rank!r}:{last_id}")
+
+
+def decode_rank_cursor(cursor: Optional[str]) -> Optional[Tuple[float, int]]:
+    if cursor is None:
+        return None
+    try:
+        rank, last_id = _decode(cursor).split(":")
+        return float(rank), int(last_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def set_next_cursor(response, rows, limit: int):
+    """When the page is full there might be more rows, so we tell the client
+    where to continue from in the `X-Next-Cursor` header.
+    """
+    if rows and len(rows) == limit:
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(rows[-1].id)
+
+
+def set_next_rank_cursor(response, rows, limit: int):
+    if rows and len(rows) == limit:
+        cursor = encode_rank_cursor(rows[-1].rank, rows[-1].id)
+        response.headers[NEXT_CURSOR_HEADER] = cursor
@@ -0,0 +1,12 @@
+"""Choose between the sync and the async app with the settings.
+
+`uvicorn sql_app.server:app`
+"""
+from .config import settings
+
+if settings.async_mode:
+    from .async_main import app
+else:
+    from .main import app
+
+__all__ = ["app"]
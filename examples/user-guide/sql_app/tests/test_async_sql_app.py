@@ -0,0 +1,88 @@
+"""The same kind of tests as in `test_sql_app.py`, for the app in `async_main.py`.
+
+The testing database is an in-memory SQLite database through `aiosqlite`.
+"""
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from ..async_main import app, get_db
+from ..database import Base
+
+engine = create_async_engine("sqlite+aiosqlite://", poolclass=StaticPool)
+TestingSessionLocal = sessionmaker(
+    engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
+)
+
+
+async def create_tables():
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+
+async def override_get_db():
+    async with TestingSessionLocal() as db:
+        yield db
+
+
+app.dependency_overrides[get_db] = override_get_db
+# create the tables in the testing database instead of `sql_app.db`, and close
+# its connection at the end (`aiosqlite` runs each connection in a thread)
+app.router.on_startup = [create_tables]
+app.router.on_shutdown = [engine.dispose]
+
+
+def test_create_user_and_items():
+    with TestClient(app) as client:
+        response = client.post(
+            "/users/",
+            json={"email": "async@example.com", "password": "chimichangas4life"},
+        )
+        assert response.status_code == 200, response.text
+        user_id = response.json()["id"]
+        assert response.json()["items"] == []
+
+        response = client.post(
+            "/users/", json={"email": "async@example.com", "password": "again"}
+        )
+        assert response.status_code == 400, response.text
+
+        response = client.post(f"/users/{user_id}/items", json={"title": "Async"})
+        assert response.status_code == 200, response.text
+
+        response = client.get(f"/users/{user_id}")
+        assert response.status_code == 200, response.text
+        assert [item["title"] for item in response.json()["items"]] == ["Async"]
+
+        response = client.get("/users/", params={"limit": 1})
+        assert response.json()[0]["email"] == "async@example.com"
+        assert "X-Next-Cursor" in response.headers
+
+
+def test_offset_pages_are_ordered_by_id():
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    with TestClient(app) as client:
+        for i in range(3):
+            client.post(
+                "/users/", json={"email": f"order-{i}@example.com", "password": "x"}
+            )
+        event.listen(
+            engine.sync_engine, "before_cursor_execute", before_cursor_execute
+        )
+        try:
+            users = client.get("/users/", params={"limit": 2}).json()
+            client.get("/items", params={"limit": 2})
+        finally:
+            event.remove(
+                engine.sync_engine, "before_cursor_execute", before_cursor_execute
+            )
+    ids = [user["id"] for user in users]
+    assert ids == sorted(ids)
+    assert any("ORDER BY users.id" in statement for statement in statements)
+    assert any("ORDER BY items.id" in statement for statement in statements)
@@ -0,0 +1,356 @@
+"""
+Same idea as the tests for the advanced `sql_app`: we override the `get_db`
+dependency with a session bound to a separate testing database.
+
+Here the testing database lives in memory (`sqlite://`), and `StaticPool`
+makes every session share that single connection, so the tables created by
+`Base.metadata.create_all` are visible to all of them and nothing is left on
+disk after the tests.
+"""
+import csv
+import io
+import json
+
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from .. import crud, models
+from ..database import Base
+from ..main import app, get_db
+from ..middleware import DBSessionMiddleware
+
+engine = create_engine(
+    "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+Base.metadata.create_all(bind=engine)
+
+
+def override_get_db():
+    try:
+        db = TestingSessionLocal()
+        yield db
+    finally:
+        db.close()
+
+
+app.dependency_overrides[get_db] = override_get_db
+
+client = TestClient(app)
+
+
+@pytest.fixture
+def count_queries():
+    """Count the SQL statements sent to the testing database while the test runs."""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    yield statements
+    event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+
+def create_user(email: str):
+    response = client.post("/users/", json={"email": email, "password": "secret"})
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def test_create_user():
+    user_id = create_user("deadpool@example.com")["id"]
+
+    response = client.get(f"/users/{user_id}")
+    assert response.status_code == 200, response.text
+    assert response.json()["email"] == "deadpool@example.com"
+
+
+def test_read_items_with_cursor():
+    """Following `X-Next-Cursor` walks through every item exactly once."""
+    user_id = create_user("cursor@example.com")["id"]
+    for i in range(5):
+        client.post(f"/users/{user_id}/items", json={"title": f"Item {i}"})
+
+    expected = [item["id"] for item in client.get("/items").json()]
+    seen = []
+    response = client.get("/items", params={"limit": 2})
+    while True:
+        seen.extend(item["id"] for item in response.json())
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            break
+        response = client.get("/items", params={"limit": 2, "after": cursor})
+    assert seen == expected
+
+
+def test_offset_pages_are_ordered_by_id(count_queries):
+    """The first page (with `skip`) gives the cursor for the next one, so it
+    has to be in `id` order too.
+    """
+    user_id = create_user("offset-order@example.com")["id"]
+    for i in range(3):
+        client.post(f"/users/{user_id}/items", json={"title": f"Item {i}"})
+
+    count_queries.clear()
+    response = client.get("/items", params={"limit": 2, "owner_id": user_id})
+    ids = [item["id"] for item in response.json()]
+    assert ids == sorted(ids)
+    assert any("ORDER BY items.id" in statement for statement in count_queries)
+
+    count_queries.clear()
+    client.get("/users/", params={"limit": 2})
+    assert any("ORDER BY users.id" in statement for statement in count_queries)
+
+
+def test_read_items_with_invalid_cursor():
+    response = client.get("/items", params={"after": "not a cursor!"})
+    assert response.status_code == 400, response.text
+
+
+@pytest.mark.parametrize(
+    # + 1 query to read the `X-Total-Count`
+    "items, expected_queries", [("selectin", 3), ("joined", 2), ("none", 2)]
+)
+def test_read_users_constant_queries(count_queries, items, expected_queries):
+    """A page of users costs the same number of queries however many users it has."""
+    for i in range(10):
+        user_id = create_user(f"n-plus-one-{items}-{i}@example.com")["id"]
+        client.post(f"/users/{user_id}/items", json={"title": f"Item {i}"})
+
+    for limit in (1, 10):
+        count_queries.clear()
+        response = client.get("/users/", params={"limit": limit, "items": items})
+        assert response.status_code == 200, response.text
+        assert len(response.json()) == limit
+        assert len(count_queries) == expected_queries
+    if items == "none":
+        assert all(user["items"] == [] for user in response.json())
+    else:
+        assert any(user["items"] for user in response.json())
+
+
+def test_create_users_bulk(count_queries):
+    users = [
+        {"email": f"bulk-{i}@example.com", "password": "secret"} for i in range(1200)
+    ]
+    response = client.post("/users/bulk", json=users)
+    assert response.status_code == 200, response.text
+    data = response.json()
+    assert [user["email"] for user in data] == [user["email"] for user in users]
+    assert len({user["id"] for user in data}) == len(users)
+    # 1200 rows are 3 chunks: each chunk is one email check, one `executemany`
+    # insert and one read back, plus one update of the row counts
+    assert len(count_queries) == 10
+
+    response = client.post(
+        "/users/bulk",
+        json=[
+            {"email": "bulk-0@example.com", "password": "secret"},
+            {"email": "bulk-new@example.com", "password": "secret"},
+            {"email": "bulk-new@example.com", "password": "secret"},
+        ],
+    )
+    assert response.status_code == 400, response.text
+    assert response.json()["detail"]["emails"] == [
+        "bulk-0@example.com",
+        "bulk-new@example.com",
+    ]
+    assert client.get("/users/", params={"limit": 2000}).json()[-1]["email"] == (
+        "bulk-1199@example.com"
+    )
+
+
+def test_create_items_bulk(count_queries):
+    user_id = create_user("bulk-items@example.com")["id"]
+    items = [{"title": f"Bulk item {i}"} for i in range(1200)]
+    count_queries.clear()
+    response = client.post(f"/users/{user_id}/items/bulk", json=items)
+    assert response.status_code == 200, response.text
+    # one `executemany` per chunk of 500, not one `INSERT` per item
+    inserts = [s for s in count_queries if s.startswith("INSERT INTO items")]
+    assert len(inserts) == 3
+    data = response.json()
+    assert [item["title"] for item in data] == [item["title"] for item in items]
+    assert all(item["owner_id"] == user_id for item in data)
+
+    response = client.get(f"/users/{user_id}")
+    assert [item["id"] for item in response.json()["items"]] == [
+        item["id"] for item in data
+    ]
+
+
+def test_read_user_cache(count_queries):
+    crud.user_cache.clear()
+    user_id = create_user("cached@example.com")["id"]
+
+    client.get(f"/users/{user_id}")
+    count_queries.clear()
+    response = client.get(f"/users/{user_id}")
+    assert response.json()["items"] == []
+    assert count_queries == []
+    assert crud.user_cache.cache_info().hits == 1
+
+    # creating an item removes the cached user, so the next read sees it
+    client.post(f"/users/{user_id}/items", json={"title": "Fresh"})
+    response = client.get(f"/users/{user_id}")
+    assert [item["title"] for item in response.json()["items"]] == ["Fresh"]
+
+
+def test_create_user_cached_duplicate_check():
+    crud.user_cache.clear()
+    email = "cached-duplicate@example.com"
+    # the first check caches "no user with this email", which creating the
+    # user has to forget
+    create_user(email)
+    response = client.post("/users/", json={"email": email, "password": "secret"})
+    assert response.status_code == 400, response.text
+    info = crud.user_cache.cache_info()
+    assert (info.hits, info.misses) == (0, 3)
+    response = client.post("/users/", json={"email": email, "password": "secret"})
+    assert response.status_code == 400, response.text
+    assert crud.user_cache.cache_info().hits == 2
+
+
+def test_db_session_middleware_is_lazy():
+    sessions = []
+
+    def session_factory():
+        sessions.append(TestingSessionLocal())
+        return sessions[-1]
+
+    lazy_app = FastAPI()
+    lazy_app.add_middleware(DBSessionMiddleware, session_factory=session_factory)
+
+    @lazy_app.get("/health")
+    def health():
+        return {"status": "ok"}
+
+    @lazy_app.get("/stream")
+    def stream(request: Request):
+        def emails():
+            # still usable while the body is being streamed
+            for user in request.state.db.query(models.User).limit(3):
+                yield user.email + "\n"
+
+        return StreamingResponse(emails())
+
+    lazy_client = TestClient(lazy_app)
+    assert lazy_client.get("/health").status_code == 200
+    assert sessions == []
+
+    response = lazy_client.get("/stream")
+    assert response.status_code == 200, response.text
+    assert len(response.text.splitlines()) == 3
+    assert len(sessions) == 1
+
+
+def test_search_items():
+    user_id = create_user("search@example.com")["id"]
+    items = [
+        {"title": "Red apple pie", "description": "apple apple apple"},
+        {"title": "Apple juice", "description": "a drink"},
+        {"title": "Banana", "description": "not an apple? \"quoted\""},
+        {"title": "Cherry", "description": "nothing to see"},
+    ]
+    for item in items:
+        client.post(f"/users/{user_id}/items", json=item)
+
+    response = client.get("/items/search", params={"q": "apple"})
+    assert response.status_code == 200, response.text
+    titles = [item["title"] for item in response.json()]
+    assert titles[0] == "Red apple pie"
+    assert set(titles) == {"Red apple pie", "Apple juice", "Banana"}
+
+    seen = []
+    response = client.get("/items/search", params={"q": "apple", "limit": 1})
+    while True:
+        seen.extend(item["title"] for item in response.json())
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            break
+        response = client.get(
+            "/items/search", params={"q": "apple", "limit": 1, "after": cursor}
+        )
+    assert seen == titles
+
+    # FTS5 query syntax is searched as normal text
+    response = client.get("/items/search", params={"q": '"quoted'})
+    assert [item["title"] for item in response.json()] == ["Banana"]
+
+
+def test_search_items_after_drop_all_and_create_all():
+    """`drop_all()` leaves `items_fts` but drops its triggers with `items`, the
+    next `create_all()` has to create them again.
+    """
+    other_engine = create_engine("sqlite://", poolclass=StaticPool)
+    Base.metadata.create_all(bind=other_engine)
+    Base.metadata.drop_all(bind=other_engine)
+    Base.metadata.create_all(bind=other_engine)
+    with other_engine.begin() as connection:
+        connection.exec_driver_sql(
+            "INSERT INTO users (email, hashed_password, is_active) "
+            "VALUES ('fts@example.com', 'x', 1)"
+        )
+        connection.exec_driver_sql(
+            "INSERT INTO items (title, description, owner_id) "
+            "VALUES ('Recreated triggers', 'still indexed', 1)"
+        )
+        rows = connection.exec_driver_sql(
+            "SELECT rowid FROM items_fts WHERE items_fts MATCH 'recreated'"
+        ).all()
+    assert len(rows) == 1
+
+
+def test_export_items():
+    user_id = create_user("export@example.com")["id"]
+    client.post(f"/users/{user_id}/items", json={"title": "Exported, with comma"})
+    expected = client.get("/items", params={"limit": 10000}).json()
+
+    response = client.get("/export/items")
+    assert response.status_code == 200, response.text
+    assert response.headers["content-type"] == "application/x-ndjson"
+    lines = response.text.splitlines()
+    assert [json.loads(line) for line in lines] == expected
+
+    response = client.get("/export/items", params={"format": "csv"})
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert [row["title"] for row in rows] == [item["title"] for item in expected]
+    assert rows[-1]["title"] == "Exported, with comma"
+
+
+def test_export_users():
+    response = client.get("/export/users", params={"format": "csv"})
+    assert response.status_code == 200, response.text
+    header, *rows = response.text.splitlines()
+    assert header == "id,email,is_active"
+    assert len(rows) == len(client.get("/users/", params={"limit": 10000}).json())
+
+
+def test_total_count_headers(count_queries):
+    user_id = create_user("counted@example.com")["id"]
+    client.post(f"/users/{user_id}/items", json={"title": "One"})
+    client.post(f"/users/{user_id}/items/bulk", json=[{"title": "Two"}] * 2)
+
+    db = TestingSessionLocal()
+    users = db.query(models.User).count()
+    items = db.query(models.Item).count()
+    db.close()
+
+    count_queries.clear()
+    response = client.get("/users/", params={"limit": 1})
+    assert response.headers["X-Total-Count"] == str(users)
+    assert not any("count(" in statement.lower() for statement in count_queries)
+
+    response = client.get("/items", params={"limit": 1})
+    assert response.headers["X-Total-Count"] == str(items)
+
+    response = client.get("/items", params={"owner_id": user_id})
+    assert response.headers["X-Total-Count"] == "3"
+    assert [item["title"] for item in response.json()] == ["One", "Two", "Two"]